@@ -0,0 +1,76 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from MeshCache import CACHE_PATH
+
+# baked color arrays, one .npy per (mesh, texture, projection) combination
+BAKE_CACHE_PATH: Path = CACHE_PATH / "bakes"
+BAKE_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+
+
+class BakeCache:
+    """
+    Size-bounded on-disk cache of baked texture colors.
+    File mtimes double as the LRU clock: hits touch the entry and
+    writes evict the stalest entries until the cache fits again.
+    """
+
+    def __init__(self, cache_path: Path = BAKE_CACHE_PATH, max_bytes: int = BAKE_CACHE_MAX_BYTES):
+        self._cache_path: Path = Path(cache_path)
+        self.max_bytes: int = max_bytes
+        self.hits: int = 0
+        self.misses: int = 0
+
+    @staticmethod
+    def key(*parts) -> str:
+        return hashlib.sha256('|'.join(str(p) for p in parts).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        path = self._cache_path / f'{key}.npy'
+        try:
+            colors = np.load(path)
+        except (FileNotFoundError, ValueError, OSError):
+            self.misses += 1
+            return None
+
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass  # evicted by another worker since, the colors are still good
+        self.hits += 1
+        return colors
+
+    def put(self, key: str, colors: np.ndarray) -> None:
+        os.makedirs(self._cache_path, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self._cache_path, prefix='.bake-')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, colors)
+        os.replace(tmp_path, self._cache_path / f'{key}.npy')
+
+        self.evict()
+
+    def evict(self) -> None:
+        """Drop least recently used entries until the cache is under budget"""
+        entries = []
+        for path in self._cache_path.glob('*.npy'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue  # evicted by another worker
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,280 @@
+import errno
+import hashlib
+import json
+import os
+import shutil
+import signal
+import subprocess
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+# point this at a stand-in script to exercise the pipeline without colmap
+COLMAP_BIN: str = os.environ.get("COLMAP_BIN", "colmap")
+
+STATE_FILE: str = "pipeline_state.json"
+REPORT_FILE: str = "run_report.json"
+
+# colmap's own thread/cache knobs per stage, limits are applied through these
+THREAD_OPTIONS: dict[str, str] = {
+    "feature_extractor": "--SiftExtraction.num_threads",
+    "sequential_matcher": "--SiftMatching.num_threads",
+    "mapper": "--Mapper.num_threads",
+    "stereo_fusion": "--StereoFusion.num_threads",
+}
+CACHE_OPTIONS: dict[str, str] = {
+    "patch_match_stereo": "--PatchMatchStereo.cache_size",
+    "stereo_fusion": "--StereoFusion.cache_size",
+}
+# CUDA reserves far more address space than it ever touches, these are capped through cache_size only
+CUDA_STAGES: tuple[str, ...] = ("patch_match_stereo",)
+
+# a stage killed by one of these was stopped, not broken (negative codes are signals, 128+ a shell's way)
+INTERRUPT_EXIT_CODES: frozenset[int] = frozenset(
+    code for sig in (signal.SIGINT, signal.SIGTERM) for code in (-sig, 128 + sig)
+)
+
+
+class ColmapError(IOError):
+    def __init__(self, stage: str, reason: str):
+        super().__init__(f"colmap {stage}: {reason}")
+        self.stage = stage
+        self.reason = reason
+
+
+class ColmapInterrupted(ColmapError):
+    """The run was stopped (Ctrl-C, cancel), it resumes from this stage next time"""
+
+
+@dataclass(frozen=True)
+class StageLimits:
+    cpus: Optional[int] = None
+    memory_mb: Optional[int] = None
+
+    def apply(self, stage: str, args: list[str]) -> list[str]:
+        """Stage arguments with colmap's thread count and cache size capped"""
+        args = list(args)
+        if self.cpus and stage in THREAD_OPTIONS:
+            args += [THREAD_OPTIONS[stage], str(self.cpus)]
+        if self.memory_mb and stage in CACHE_OPTIONS:
+            # cache size is in GB, leave headroom for everything else
+            args += [CACHE_OPTIONS[stage], f"{max(self.memory_mb / 2048, 0.25):g}"]
+        return args
+
+    def wrap(self, stage: str, cmd: list[str]) -> list[str]:
+        """
+        The command under a hard address-space cap, so a runaway stage fails instead of swapping the box.
+        A shell sets the cap and execs the stage, so it holds from the first instruction
+        (preexec_fn isn't safe with the queue's worker threads).
+        """
+        if not self.memory_mb or stage in CUDA_STAGES:
+            return cmd
+        if shutil.which(cmd[0]) is None:
+            # the shell would only report it as exit code 127
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), cmd[0])
+        return ["sh", "-c", f'ulimit -v {self.memory_mb * 1024} && exec "$@"', cmd[0], *cmd]
+
+
+@dataclass
+class Stage:
+    name: str
+    args: list[str]
+    # produced files/dirs, all must exist (and dirs be non-empty) for the stage to count as done
+    outputs: list[Path]
+    # external inputs whose contents are fingerprinted, e.g. the image folder
+    inputs: list[Path] = field(default_factory=list)
+    # removed before the stage re-runs, colmap builds on whatever it finds (defaults to outputs)
+    clean: Optional[list[Path]] = None
+
+    def fingerprint(self) -> str:
+        digest = hashlib.sha256(json.dumps(self.args).encode())
+        for path in self.inputs:
+            entries = sorted(path.iterdir()) if path.is_dir() else [path]
+            for entry in entries:
+                if entry.exists():
+                    stat = entry.stat()
+                    digest.update(f"{entry.name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        return digest.hexdigest()
+
+    def outputs_ready(self) -> bool:
+        for path in self.outputs:
+            if not path.exists() or (path.is_dir() and not any(path.iterdir())):
+                return False
+        return True
+
+    def clear(self) -> None:
+        for path in (self.outputs if self.clean is None else self.clean):
+            if path.is_dir():
+                shutil.rmtree(path)
+            elif path.exists():
+                os.remove(path)
+
+
+def run_measured(cmd: list[str], limits: StageLimits = StageLimits(), stage: str = "") -> tuple[int, float, int]:
+    """Run a command, returning (exit code, wall seconds, peak RSS in KiB of that child)"""
+    start = time.perf_counter()
+    proc = subprocess.Popen(limits.wrap(stage, cmd))
+    try:
+        _, status, usage = os.wait4(proc.pid, 0)
+    except BaseException:
+        # whatever interrupted the wait, the stage never outlives it unreaped
+        proc.kill()
+        proc.wait()
+        raise
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return proc.returncode, time.perf_counter() - start, usage.ru_maxrss
+
+
+class ColmapPipeline:
+    """
+    The scan-to-dense-cloud COLMAP run as explicit stages.
+    A stage is skipped when it finished before with the same fingerprint and its
+    outputs are still there; once any stage runs, every later stage runs too.
+    A failed run therefore resumes from the failing stage.
+    Every run writes a report with wall time, exit code and peak memory per stage.
+    Limits are per stage name and don't count towards the fingerprint.
+    Setting `cancel` stops the run before its next stage.
+    """
+
+    def __init__(
+        self,
+        collection_path: Path,
+        colmap_bin: str = COLMAP_BIN,
+        limits: Optional[dict[str, StageLimits]] = None,
+        cancel: Optional[threading.Event] = None
+    ):
+        self.collection_path = Path(collection_path)
+        self.root = self.collection_path.parent
+        self.colmap_bin = colmap_bin
+        self.limits = limits or {}
+        self.cancel = cancel or threading.Event()
+
+        self.db_path = self.root / "datbase.db"
+        self.sparse_path = self.root / "sparse"
+        self.dense_path = self.root / "dense"
+        self.fused_path = self.dense_path / "fused.ply"
+
+    def stages(self) -> list[Stage]:
+        colmap = self.colmap_bin
+        return [
+            Stage("feature_extractor", [
+                colmap, "feature_extractor",
+                "--database_path", str(self.db_path),
+                "--image_path", str(self.collection_path),
+                "--ImageReader.single_camera", "1",
+                "--SiftExtraction.max_num_features", "8192"
+            ], outputs=[self.db_path], inputs=[self.collection_path]),
+            Stage("sequential_matcher", [
+                colmap, "sequential_matcher",
+                "--database_path", str(self.db_path),
+                "--SequentialMatching.overlap", "10",
+            ], outputs=[self.db_path], clean=[]),  # the extractor's database, matched in place
+            Stage("mapper", [
+                colmap, "mapper",
+                "--database_path", str(self.db_path),
+                "--image_path", str(self.collection_path),
+                "--output_path", str(self.sparse_path),
+                "--Mapper.min_num_matches", "20"
+            ], outputs=[self.sparse_path / "0"], clean=[self.sparse_path]),
+            Stage("image_undistorter", [
+                colmap, "image_undistorter",
+                "--image_path", str(self.collection_path),
+                "--input_path", str(self.sparse_path / "0"),
+                "--output_path", str(self.dense_path),
+                "--output_type", "COLMAP"
+            ], outputs=[self.dense_path / "images", self.dense_path / "sparse"], clean=[self.dense_path]),
+            Stage("patch_match_stereo", [
+                colmap, "patch_match_stereo",
+                "--workspace_path", str(self.dense_path),
+                "--workspace_format", "COLMAP",
+                "--PatchMatchStereo.geom_consistency", "true",
+            ], outputs=[self.dense_path / "stereo" / "depth_maps"],
+               clean=[self.dense_path / "stereo" / "depth_maps", self.dense_path / "stereo" / "normal_maps"]),
+            Stage("stereo_fusion", [
+                colmap, "stereo_fusion",
+                "--workspace_path", str(self.dense_path),
+                "--workspace_format", "COLMAP",
+                "--input_type", "geometric",
+                "--output_path", str(self.fused_path)
+            ], outputs=[self.fused_path]),
+        ]
+
+    def _load_state(self) -> dict:
+        try:
+            with open(self.root / STATE_FILE) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _write_json(self, name: str, data: dict) -> None:
+        tmp_path = self.root / f".{name}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, self.root / name)
+
+    def _make_dirs(self) -> None:
+        # colmap wants its output folders to exist
+        os.makedirs(self.sparse_path, exist_ok=True)
+        os.makedirs(self.dense_path, exist_ok=True)
+
+    def run(self) -> Path:
+        self._make_dirs()
+        state = self._load_state()
+        report = {"started_at": time.time(), "stages": []}
+        upstream_ran = False
+
+        try:
+            for stage in self.stages():
+                fingerprint = stage.fingerprint()
+                if not upstream_ran and state.get(stage.name) == fingerprint and stage.outputs_ready():
+                    report["stages"].append({"name": stage.name, "skipped": True})
+                    continue
+
+                if self.cancel.is_set():
+                    raise ColmapInterrupted(stage.name, "cancelled")
+
+                upstream_ran = True
+                state.pop(stage.name, None)
+                self._write_json(STATE_FILE, state)
+
+                # start from scratch, e.g. the extractor skips images already in the database
+                stage.clear()
+                self._make_dirs()
+
+                print(f"colmap {stage.name}...")
+                limits = self.limits.get(stage.name, StageLimits())
+                try:
+                    exit_code, wall_time, peak_rss_kib = run_measured(
+                        limits.apply(stage.name, stage.args), limits, stage.name
+                    )
+                except OSError as e:
+                    # e.g. no colmap binary at COLMAP_BIN
+                    raise ColmapError(stage.name, f"could not start: {e}")
+                report["stages"].append({
+                    "name": stage.name,
+                    "skipped": False,
+                    "exit_code": exit_code,
+                    "wall_time_s": round(wall_time, 3),
+                    "peak_rss_mib": round(peak_rss_kib / 1024, 1)
+                })
+
+                if exit_code in INTERRUPT_EXIT_CODES or (exit_code != 0 and self.cancel.is_set()):
+                    raise ColmapInterrupted(stage.name, f"interrupted ({exit_code})")
+                if exit_code != 0:
+                    raise ColmapError(stage.name, f"exited with {exit_code}")
+                if not stage.outputs_ready():
+                    raise ColmapError(stage.name, "finished without producing its outputs")
+
+                state[stage.name] = fingerprint
+                self._write_json(STATE_FILE, state)
+        except ColmapError as e:
+            report["failed_stage"] = e.stage
+            report["interrupted"] = isinstance(e, ColmapInterrupted)
+            raise
+        finally:
+            report["finished_at"] = time.time()
+            self._write_json(REPORT_FILE, report)
+
+        return self.fused_path
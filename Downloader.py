@@ -0,0 +1,157 @@
+import json
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from typing import Callable, Iterable, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# statuses worth another try, everything else non-2xx fails straight away
+RETRY_STATUSES: frozenset[int] = frozenset({408, 425, 429, 500, 502, 503, 504})
+# jobs submitted ahead of the worker threads, per thread
+SUBMIT_AHEAD: int = 2
+
+
+class DownloadError(Exception):
+    def __init__(self, url: str, reason: str, attempts: int):
+        super().__init__(f'{url}: {reason} after {attempts} attempt(s)')
+        self.url = url
+        self.reason = reason
+        self.attempts = attempts
+
+
+class RateLimiter:
+    """Token bucket shared by every download thread"""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class Downloader:
+    """
+    Pooled keep-alive HTTP fetching with bounded concurrency, timeouts,
+    exponential-backoff retries and a failure report.
+    Concurrency is an I/O setting and deliberately not tied to the CPU count.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 32,
+        timeout: tuple[float, float] = (5.0, 30.0),
+        max_retries: int = 4,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        rate_limit: Optional[float] = None
+    ):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+
+        # one pool slot per worker thread so connections are always reused
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.failures: dict[str, dict] = {}
+        self._failures_lock = threading.Lock()
+
+    def _sleep_before_retry(self, attempt: int, retry_after: Optional[str] = None) -> None:
+        # jitter so threads don't retry in lockstep
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, float(retry_after))  # never earlier than the server asked
+        time.sleep(delay)
+
+    def fetch(self, url: str, headers: Optional[dict] = None) -> requests.Response:
+        """GET with retries, returns the final response (2xx or 304) or raises DownloadError"""
+        reason = ''
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+
+            retry_after = None
+            try:
+                response = self.session.get(url, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                reason = type(e).__name__
+            else:
+                if response.ok or response.status_code == 304:
+                    return response
+                reason = f'HTTP {response.status_code}'
+                if response.status_code not in RETRY_STATUSES:
+                    raise DownloadError(url, reason, attempt + 1)
+                retry_after = response.headers.get('Retry-After')
+
+            if attempt < self.max_retries:
+                self._sleep_before_retry(attempt, retry_after)
+
+        raise DownloadError(url, reason, self.max_retries + 1)
+
+    def _record_failure(self, key: str, url: str, reason: str, attempts: int) -> None:
+        with self._failures_lock:
+            self.failures[key] = {'url': url, 'reason': reason, 'attempts': attempts}
+
+    def run(
+        self,
+        jobs: Iterable[tuple],
+        handle: Callable[[str, str, requests.Response], None],
+        on_done: Optional[Callable[[], None]] = None
+    ) -> dict[str, dict]:
+        """
+        Fetch every (key, url) or (key, url, headers) job and call `handle(key, url, response)`.
+        Jobs are pulled from the iterable as threads free up, so it can be a lazy generator.
+        Failed jobs, from the network or from `handle`, end up in the returned report.
+        """
+        def work(key: str, url: str, headers: Optional[dict] = None) -> None:
+            try:
+                handle(key, url, self.fetch(url, headers))
+            except DownloadError as e:
+                self._record_failure(key, url, e.reason, e.attempts)
+            except Exception as e:
+                self._record_failure(key, url, f'{type(e).__name__}: {e}', 1)
+
+        def finished(futures) -> None:
+            for future in futures:
+                future.result()  # work() records its own failures, anything else is a bug
+                if on_done:
+                    on_done()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            pending = set()
+            for job in jobs:
+                if len(pending) >= SUBMIT_AHEAD * self.concurrency:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    finished(done)
+                pending.add(executor.submit(work, *job))
+            finished(as_completed(pending))
+
+        return self.failures
+
+    def write_report(self, path: str) -> None:
+        with open(path, 'w') as f:
+            json.dump(self.failures, f, indent=2)
+
+    def close(self) -> None:
+        self.session.close()
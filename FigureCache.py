@@ -0,0 +1,44 @@
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+from MeshCache import CACHE_PATH
+
+# serialized first-paint figures, one file per model content hash
+# .cache
+# | figures
+# | | <sha256>.v<version>.json <- {"meta": {...}, "figure": {...}}
+FIGURE_CACHE_PATH: Path = CACHE_PATH / "figures"
+
+# bump whenever the initial figure or its metadata changes shape
+FIGURE_CACHE_VERSION: int = 3
+
+
+class FigureCache:
+    """
+    The initial client figure and the layout values it needs, keyed by model hash.
+    A hit serves the first page without importing or loading the mesh at all.
+    """
+
+    def __init__(self, cache_path: Path = FIGURE_CACHE_PATH):
+        self._cache_path: Path = Path(cache_path)
+
+    def path(self, key: str) -> Path:
+        return self._cache_path / f"{key}.v{FIGURE_CACHE_VERSION}.json"
+
+    def get(self, key: str) -> Optional[dict]:
+        try:
+            with open(self.path(key), 'rb') as f:
+                return json.loads(f.read())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def put(self, key: str, figure_json: str, meta: dict) -> None:
+        """Write an already serialized figure, atomically so workers never read half a file"""
+        os.makedirs(self._cache_path, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self._cache_path, prefix=f'.{key}-')
+        with os.fdopen(fd, 'w') as f:
+            f.write(f'{{"meta": {json.dumps(meta)}, "figure": {figure_json}}}')
+        os.replace(tmp_path, self.path(key))
@@ -0,0 +1,62 @@
+import base64
+from typing import Container
+
+import numpy as np
+
+# numeric trace attributes sent as plotly.js typed arrays rather than decimal lists
+TYPED_KEYS: tuple[str, ...] = ('x', 'y', 'z', 'i', 'j', 'k', 'intensity')
+
+# narrowest first, plotly.js names
+UNSIGNED_TYPES: tuple[str, ...] = ('u1', 'u2', 'u4')
+SIGNED_TYPES: tuple[str, ...] = ('i1', 'i2', 'i4')
+NUMERIC_TYPES: tuple[str, ...] = (*UNSIGNED_TYPES, *SIGNED_TYPES, 'f4', 'f8')
+
+
+def narrow_dtype(arr: np.ndarray) -> str:
+    """Smallest plotly.js typed array that holds `arr` (float32 for anything fractional)"""
+    if arr.dtype.kind == 'f':
+        return 'f4'
+    if arr.size == 0:
+        return 'u1'
+    lo, hi = int(arr.min()), int(arr.max())
+    for name in (UNSIGNED_TYPES if lo >= 0 else SIGNED_TYPES):
+        info = np.iinfo(np.dtype(name))
+        if info.min <= lo and hi <= info.max:
+            return name
+    return 'f8'  # wider than plotly.js integer arrays go
+
+
+def encode_array(values) -> dict:
+    arr = np.asarray(values)
+    dtype = narrow_dtype(arr)
+    data = np.ascontiguousarray(arr, dtype=np.dtype(dtype).newbyteorder('<'))
+    return {'dtype': dtype, 'bdata': base64.b64encode(data.tobytes()).decode('ascii')}
+
+
+def encode_value(value):
+    """Typed array spec for a numeric array, anything else is returned as is"""
+    if isinstance(value, dict):
+        # plotly >= 6 already base64s numpy arrays, but as float64 and signed indices
+        if value.get('dtype') in NUMERIC_TYPES and 'bdata' in value and 'shape' not in value:
+            dtype = np.dtype(value['dtype']).newbyteorder('<')
+            return encode_array(np.frombuffer(base64.b64decode(value['bdata']), dtype=dtype))
+        return value
+    if isinstance(value, (np.ndarray, list, tuple)):
+        arr = np.asarray(value)
+        if arr.ndim == 1 and arr.dtype.kind in 'iuf':
+            return encode_array(arr)
+    return value
+
+
+def encode_figure(figure: dict, skip: Container[int] = ()) -> dict:
+    """
+    Swap the numeric arrays of every trace for compact typed arrays, in place.
+    Traces in `skip` keep plain lists, e.g. markers that patches append to.
+    """
+    for index, trace in enumerate(figure.get('data', ())):
+        if index in skip:
+            continue
+        for key in TYPED_KEYS:
+            if key in trace:
+                trace[key] = encode_value(trace[key])
+    return figure
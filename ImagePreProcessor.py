@@ -1,7 +1,10 @@
 from PIL import Image
 from enum import Enum
+from io import BytesIO
+from typing import Iterable, Optional, Union
+import hashlib
 
-# download quality types for future changes 
+# download quality types for future changes
 class IMAGE_DOWNLOAD_QUALITY(Enum):
     LOW = 85
     HIGH = 95
@@ -10,14 +13,96 @@ class IMAGE_RESOLUTION_QUALITY(Enum):
     LOW = (64, 64)
     HIGH = (96, 96)
 
+# speed / quality trade-offs built from the enums above
+# (resolution, jpeg quality, resampling filter, reducing gap or None for an exact resize)
+class PROCESSING_PRESET(Enum):
+    FAST = (IMAGE_RESOLUTION_QUALITY.LOW, IMAGE_DOWNLOAD_QUALITY.LOW, Image.Resampling.BILINEAR, 2.0)
+    BALANCED = (IMAGE_RESOLUTION_QUALITY.HIGH, IMAGE_DOWNLOAD_QUALITY.LOW, Image.Resampling.LANCZOS, 3.0)
+    QUALITY = (IMAGE_RESOLUTION_QUALITY.HIGH, IMAGE_DOWNLOAD_QUALITY.HIGH, Image.Resampling.LANCZOS, None)
+
+    @property
+    def resolution(self) -> tuple[int, int]:
+        return self.value[0].value
+
+    @property
+    def jpeg_quality(self) -> int:
+        return self.value[1].value
+
+    @property
+    def resample(self) -> Image.Resampling:
+        return self.value[2]
+
+    @property
+    def reducing_gap(self) -> Optional[float]:
+        return self.value[3]
+
+DEFAULT_PRESET: PROCESSING_PRESET = PROCESSING_PRESET.BALANCED
+
+ImageSource = Union[bytes, str, Image.Image]
+
 class ImagePreprocessor:
     def __init__(self) -> None:
         pass
-    
+
+    @staticmethod
+    def open(source: ImageSource, preset: PROCESSING_PRESET = DEFAULT_PRESET) -> Image.Image:
+        """
+        Open an image, decoding JPEGs at a reduced scale when the preset allows it.
+        draft() only ever picks a scale that stays at or above the target size.
+        """
+        image = source if isinstance(source, Image.Image) else Image.open(
+            BytesIO(source) if isinstance(source, bytes) else source
+        )
+        if preset.reducing_gap is not None and image.format == 'JPEG':
+            w, h = preset.resolution
+            image.draft('RGB', (int(w * preset.reducing_gap), int(h * preset.reducing_gap)))
+        return image
+
     @staticmethod
-    def format(image: Image.Image):
-        return image.resize(IMAGE_RESOLUTION_QUALITY.HIGH.value, Image.Resampling.LANCZOS)
-    
+    def to_rgb(image: Image.Image, background: tuple[int, int, int] = (255, 255, 255)) -> Image.Image:
+        # JPEG has no alpha, so composite transparent images onto a background
+        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+            image = image.convert('RGBA')
+            flat = Image.new('RGB', image.size, background)
+            flat.paste(image, mask=image.getchannel('A'))
+            return flat
+        return image if image.mode == 'RGB' else image.convert('RGB')
+
+    @staticmethod
+    def process_bytes(content: bytes, path: str, preset: PROCESSING_PRESET = DEFAULT_PRESET) -> str:
+        """Decode, flatten, resize, encode and write one image, returns the source content hash"""
+        img = ImagePreprocessor.open(content, preset)
+        img = ImagePreprocessor.format(ImagePreprocessor.to_rgb(img), preset)
+        ImagePreprocessor.save_to(img, path, preset)
+        return hashlib.sha256(content).hexdigest()
+
+    @staticmethod
+    def process_batch(
+        items: list[tuple[bytes, str]],
+        preset: PROCESSING_PRESET = DEFAULT_PRESET
+    ) -> list[tuple[Optional[str], Optional[str]]]:
+        """process_bytes over many (content, path) pairs in one call, as (hash, error) per item"""
+        results = []
+        for content, path in items:
+            try:
+                results.append((ImagePreprocessor.process_bytes(content, path, preset), None))
+            except Exception as e:
+                results.append((None, f'{type(e).__name__}: {e}'))
+        return results
+
+    @staticmethod
+    def format(image: Image.Image, preset: PROCESSING_PRESET = DEFAULT_PRESET):
+        # reducing_gap shrinks by whole factors first, then resamples the small image
+        return image.resize(preset.resolution, preset.resample, reducing_gap=preset.reducing_gap)
+
+    @staticmethod
+    def format_batch(sources: Iterable[ImageSource], preset: PROCESSING_PRESET = DEFAULT_PRESET) -> list[Image.Image]:
+        """Open, flatten and resize a list of images in a single call"""
+        return [
+            ImagePreprocessor.format(ImagePreprocessor.to_rgb(ImagePreprocessor.open(source, preset)), preset)
+            for source in sources
+        ]
+
     @staticmethod
-    def save_to(image: Image.Image, path: str):
-        image.save(path, 'JPEG', quality=IMAGE_DOWNLOAD_QUALITY.LOW.value, optimize=True)
+    def save_to(image: Image.Image, path: str, preset: PROCESSING_PRESET = DEFAULT_PRESET):
+        image.save(path, 'JPEG', quality=preset.jpeg_quality, optimize=True)
@@ -0,0 +1,184 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Iterable, Optional
+
+import requests
+
+from Downloader import Downloader
+from ImagePreProcessor import ImagePreprocessor, PROCESSING_PRESET, DEFAULT_PRESET
+
+# fetched images waiting for a process worker, the I/O threads block past this
+QUEUE_SIZE: int = 256
+# images handed to a process worker per task, amortizes the pickling round trip
+BATCH_SIZE: int = 16
+
+_DONE = object()
+
+
+class StageCounter:
+    """Items, bytes and throughput of one pipeline stage"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.failed = 0
+        self.bytes = 0
+        self._started: Optional[float] = None
+        self._last: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def add(self, n_bytes: int = 0, failed: bool = False) -> None:
+        with self._lock:
+            now = time.perf_counter()
+            self._started = self._started or now
+            self._last = now
+            if failed:
+                self.failed += 1
+            else:
+                self.count += 1
+                self.bytes += n_bytes
+
+    def rate(self) -> float:
+        if self._started is None or self._last == self._started:
+            return 0.0
+        return self.count / (self._last - self._started)
+
+    def __str__(self) -> str:
+        return (f'{self.name}: {self.count} ok, {self.failed} failed, '
+                f'{self.bytes / 1e6:.1f} MB, {self.rate():.1f} items/s')
+
+
+class IngestPipeline:
+    """
+    Two stage image ingestion: I/O threads fetch bytes into a bounded queue and
+    a process pool decodes, flattens, resizes and encodes them. A full queue
+    blocks the fetchers, and the dispatcher never has more than
+    `2 * process_workers` batches in flight, so memory stays bounded.
+    """
+
+    def __init__(
+        self,
+        downloader: Downloader,
+        process_workers: Optional[int] = None,
+        queue_size: int = QUEUE_SIZE,
+        batch_size: int = BATCH_SIZE,
+        preset: PROCESSING_PRESET = DEFAULT_PRESET
+    ):
+        self.downloader = downloader
+        self.process_workers = process_workers or os.cpu_count() or 4
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.preset = preset
+
+        self.fetched = StageCounter('fetch')
+        self.not_modified = StageCounter('not modified')
+        self.processed = StageCounter('process')
+        self.failures: dict[str, dict] = {}
+        self._failures_lock = threading.Lock()
+
+    def _dispatch(
+        self,
+        pool: ProcessPoolExecutor,
+        path_for: Callable[[str], str],
+        on_saved: Callable[[str, str, requests.Response, str], None]
+    ) -> None:
+        in_flight = threading.BoundedSemaphore(2 * self.process_workers)
+
+        def fail(batch: list[tuple[str, str, requests.Response]], e: Exception) -> None:
+            for key, url, _ in batch:
+                self.processed.add(failed=True)
+                with self._failures_lock:
+                    self.failures[key] = {'url': url, 'reason': f'{type(e).__name__}: {e}', 'attempts': 1}
+
+        def done(batch: list[tuple[str, str, requests.Response]], future: Future) -> None:
+            in_flight.release()
+            try:
+                results = future.result()
+            except Exception as e:
+                # the whole batch is lost, e.g. a worker died
+                fail(batch, e)
+                return
+
+            for (key, url, response), (content_hash, error) in zip(batch, results):
+                if error:
+                    self.processed.add(failed=True)
+                    with self._failures_lock:
+                        self.failures[key] = {'url': url, 'reason': error, 'attempts': 1}
+                    continue
+
+                self.processed.add(len(response.content))
+                on_saved(key, url, response, content_hash)
+
+        finished = False
+        while not finished:
+            # block for one image, then take whatever else is already waiting
+            batch = []
+            item = self.queue.get()
+            while item is not _DONE:
+                batch.append(item)
+                if len(batch) == self.batch_size:
+                    break
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            finished = item is _DONE
+
+            if not batch:
+                continue
+
+            in_flight.acquire()
+            try:
+                future = pool.submit(
+                    ImagePreprocessor.process_batch,
+                    [(response.content, path_for(key)) for key, _, response in batch],
+                    self.preset
+                )
+            except Exception as e:
+                # e.g. BrokenProcessPool once a worker was OOM-killed, keep draining
+                # the queue so the fetch threads never block on a dead dispatcher
+                in_flight.release()
+                fail(batch, e)
+                continue
+            future.add_done_callback(lambda f, batch=batch: done(batch, f))
+
+    def run(
+        self,
+        jobs: Iterable[tuple],
+        path_for: Callable[[str], str],
+        on_saved: Callable[[str, str, requests.Response, str], None],
+        on_fetched: Optional[Callable[[], None]] = None
+    ) -> dict[str, dict]:
+        """
+        Fetch and process every job, `on_saved(key, url, response, content_hash)` runs once an image is on disk.
+        `url` is the one the job asked for, the response may have been redirected elsewhere.
+        Returns fetch and processing failures together.
+        """
+        def enqueue(key: str, url: str, response: requests.Response) -> None:
+            if response.status_code == 304:
+                self.not_modified.add()
+                return
+            self.fetched.add(len(response.content))
+            self.queue.put((key, url, response))  # blocks while the process stage catches up
+
+        with ProcessPoolExecutor(max_workers=self.process_workers) as pool:
+            dispatcher = threading.Thread(target=self._dispatch, args=(pool, path_for, on_saved), daemon=True)
+            dispatcher.start()
+
+            fetch_failures = self.downloader.run(jobs, enqueue, on_done=on_fetched)
+
+            self.queue.put(_DONE)
+            dispatcher.join()
+        # leaving the pool waits for the last images
+
+        with self._failures_lock:
+            for key, failure in fetch_failures.items():
+                self.fetched.add(failed=True)
+                self.failures.setdefault(key, failure)
+        return self.failures
+
+    def stats(self) -> list[str]:
+        return [str(self.fetched), str(self.not_modified), str(self.processed)]
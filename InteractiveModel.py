@@ -1,8 +1,10 @@
 import plotly.graph_objects as go
 import numpy as np
-from typing import Optional, Tuple
+from dash import Patch
+from typing import Optional, Sequence, Tuple
 from Model import Model
 from InteractiveModelUpdater import InteractiveModelUpdater
+from PointStore import PointStore
 
 class InteractiveModel:
 
@@ -11,111 +13,233 @@ class InteractiveModel:
     default_highlighted_point_size = default_point_size * 2
     default_highlighted_point_color = 'green'
 
-    def __init__(self, model: Model):
+    # the mesh is always trace 0, markers trace 1
+    points_trace_index = 1
+
+    # markers closer than this fraction of the model's size are the same marker
+    default_dedupe_tolerance_ratio = 1e-3
+
+    def __init__(self, model: Model, dedupe_tolerance: Optional[float] = None):
         self.__model = model
         
-        # Initialize scatter trace with numpy arrays for better performance      
-        self.points = go.Scatter3d(
-            x=np.array([], dtype=float),
-            y=np.array([], dtype=float),
-            z=np.array([], dtype=float),
-            mode='markers',  # Fix typo: 'markers' not 'markers'
-            marker=dict(
-                color=np.array([], dtype=str),
-                size=np.array([], dtype=float),
-                symbol='circle',
-                opacity=1.0,  # Ensure full opacity
-                colorscale=None  # Disable colorscale if using direct colors
-            ),
-            name='Clicked Points'
+        # Growable marker storage, also tracks XYZ coordinates and their indices
+        self.store = PointStore(
+            default_color=self.default_point_color,
+            default_size=self.default_point_size,
+            highlighted_color=self.default_highlighted_point_color,
+            highlighted_size=self.default_highlighted_point_size
         )
+        self.coord_dict: dict[Tuple[float, float, float], int] = self.store.index
 
-        # Track XYZ coordinates and their indices
-        self.coord_dict: dict[Tuple[float, float, float], int] = {}
+        # Uniform grid over marker coordinates for tolerance based de-duplication
+        self.dedupe_tolerance: float = (
+            dedupe_tolerance if dedupe_tolerance is not None
+            else self.default_dedupe_tolerance_ratio * self.__model.get_mesh_data().scale
+        )
+        self.__grid: dict[Tuple[int, int, int], list[Tuple[float, float, float]]] = {}
         
-        # Set up figure
-        self.figure = self.__model.figure
-        self.figure.add_trace(self.points)
+        # Only the layout is per session, the mesh is shared through the model
+        # and the marker trace is built from the store when a whole figure is asked for
+        self.layout = go.Layout(self.__model.figure.layout)
 
         # Initialize Updater 
         self.updater = InteractiveModelUpdater(self)
 
+        # Level of detail currently shown
+        self.lod: float = Model.FULL_LOD
+
     def get_lego_model(self) -> Model:
         return self.__model
 
+    @property
+    def figure(self) -> go.Figure:
+        """Mesh at the current level of detail plus the markers, built on demand"""
+        return go.Figure(data=[self.__model.get_lod_mesh(self.lod), self.points], layout=self.layout)
+
+    def to_state(self) -> dict:
+        """Plain, JSON-able snapshot of the annotation state"""
+        return {
+            'lod': self.lod,
+            'points': np.column_stack([
+                self.store.x, self.store.y, self.store.z, self.store.face_ids
+            ]).tolist(),
+            'highlighted': self.store.highlighted
+        }
+
+    def take_changes(self) -> dict:
+        """
+        What changed since the last call, for a store that persists marker rows individually:
+        the session values, the rewritten rows as [row, x, y, z, face_id], and the previous size
+        """
+        rows, flushed_size = self.store.take_changes()
+        x, y, z, face_ids = self.store.x, self.store.y, self.store.z, self.store.face_ids
+        return {
+            'lod': self.lod,
+            'highlighted': self.store.highlighted,
+            'size': len(self.store),
+            'flushed_size': flushed_size,
+            'points': [[row, float(x[row]), float(y[row]), float(z[row]), int(face_ids[row])] for row in rows]
+        }
+
+    @classmethod
+    def from_state(cls, model: Model, state: dict) -> 'InteractiveModel':
+        interactive_model = cls(model)
+        interactive_model.set_lod(state['lod'])
+        for x, y, z, face_id in state['points']:
+            coord = (x, y, z)
+            interactive_model.store.append(coord, x, y, z, int(face_id))
+            interactive_model.__grid.setdefault(interactive_model.__cell(x, y, z), []).append(coord)
+        if state['highlighted'] is not None:
+            interactive_model.store.highlight(state['highlighted'])
+        return interactive_model
+
+    def __cell(self, x: float, y: float, z: float) -> Tuple[int, int, int]:
+        tol = self.dedupe_tolerance or 1.0
+        return (int(np.floor(x / tol)), int(np.floor(y / tol)), int(np.floor(z / tol)))
+
+    def find_point(self, x: float, y: float, z: float) -> Optional[Tuple[float, float, float]]:
+        """Existing marker within the de-duplication tolerance, if any"""
+        if (x, y, z) in self.store:
+            return (x, y, z)
+        if not self.dedupe_tolerance:
+            return None
+
+        cx, cy, cz = self.__cell(x, y, z)
+        tol_sq = self.dedupe_tolerance ** 2
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for dz in (-1, 0, 1):
+                    for coord in self.__grid.get((cx + dx, cy + dy, cz + dz), ()):
+                        if (coord[0] - x) ** 2 + (coord[1] - y) ** 2 + (coord[2] - z) ** 2 <= tol_sq:
+                            return coord
+        return None
+
+    @staticmethod
+    def make_points_trace(x, y, z, color, size) -> go.Scatter3d:
+        return go.Scatter3d(
+            x=x,
+            y=y,
+            z=z,
+            mode='markers',
+            marker=dict(
+                color=color,
+                size=size,
+                symbol='circle',
+                opacity=1.0,  # Ensure full opacity
+                colorscale=None  # Disable colorscale if using direct colors
+            ),
+            name='Clicked Points'
+        )
+
+    @property
+    def points(self) -> go.Scatter3d:
+        """
+        Marker trace of the store's live rows. Built on demand, edits only touch the store
+        since plotly validates and copies every array it is given.
+        """
+        return self.make_points_trace(self.store.x, self.store.y, self.store.z, self.store.colors, self.store.sizes)
+
     def clear_points(self) -> None:
         """Clear all points"""
         with self.updater:
-            self.points.x = np.array([], dtype=float)
-            self.points.y = np.array([], dtype=float)
-            self.points.z = np.array([], dtype=float)
-            self.points.marker.color = np.array([], dtype=str)
-            self.points.marker.size = np.array([], dtype=float)
-            self.coord_dict.clear()
+            self.store.clear()
+            self.__grid.clear()
     
-    def add_point(self, x: float, y: float, z: float) -> None:
-        """Add a point with O(1) duplicate checking"""
-        coord = (x, y, z)
-        if coord in self.coord_dict:
-            return  # Skip duplicates
-            
-        with self.updater:
-            # Append coordinates (creates new arrays)
-            self.points.x = np.append(self.points.x, x)
-            self.points.y = np.append(self.points.y, y)
-            self.points.z = np.append(self.points.z, z)
-            
-            # Create new writable arrays for marker properties
-            new_colors = np.append(
-                np.array(self.points.marker.color, copy=True),
-                self.default_point_color
-            )
-            new_sizes = np.append(
-                np.array(self.points.marker.size, copy=True),
-                self.default_point_size
-            )
+    def add_point(self, x: float, y: float, z: float, face_id: int = -1) -> Optional[int]:
+        """Add a point with O(1) duplicate checking, returns its index if it is new"""
+        if self.find_point(x, y, z) is not None:
+            return None  # Skip duplicates within tolerance
             
-            # Update the trace
-            self.points.marker.color = new_colors
-            self.points.marker.size = new_sizes
-            
-            # Store index
-            self.coord_dict[coord] = len(self.points.x) - 1
+        coord = (x, y, z)
+        row = self.store.append(coord, x, y, z, face_id)
+        self.__grid.setdefault(self.__cell(x, y, z), []).append(coord)
+        return row
+
+    def remove_point(self, x: float, y: float, z: float) -> None:
+        """Remove a point, the last point takes over its index"""
+        coord = (x, y, z)
+        if coord not in self.store:
+            return
+
+        self.store.remove(coord)
+        self.__grid[self.__cell(x, y, z)].remove(coord)
     
     def get_figure_with_camera(self, camera_state=None):
         """Return figure with optional camera state"""
-        fig = self.figure
         if camera_state:
-            fig.update_layout(scene_camera=camera_state)
-        return fig
+            self.layout.update(scene_camera=camera_state)
+        return self.figure
+
+    def get_client_figure(self, camera_state=None) -> dict:
+        """
+        Full figure for the browser. The mesh trace comes pre-encoded from the model,
+        marker arrays are plain lists so patches can append to them.
+        """
+        if camera_state:
+            self.layout.update(scene_camera=camera_state)
+        layout = self.layout.to_plotly_json()
+        points = self.make_points_trace([], [], [], [], []).to_plotly_json()
+        points['x'] = self.store.x.tolist()
+        points['y'] = self.store.y.tolist()
+        points['z'] = self.store.z.tolist()
+        points['marker']['color'] = self.store.colors.tolist()
+        points['marker']['size'] = self.store.sizes.tolist()
+        return {'data': [self.__model.get_client_trace(self.lod), points], 'layout': layout}
+
+    def get_points_patch(
+        self,
+        appended: Sequence[int] = (),
+        changed: Sequence[int] = (),
+        cleared: bool = False,
+        camera_state=None
+    ) -> Patch:
+        """Partial figure update carrying only the marker rows that changed"""
+        patch = Patch()
+        points = patch['data'][self.points_trace_index]
+
+        if cleared:
+            for key in ('x', 'y', 'z'):
+                points[key] = []
+            points['marker']['color'] = []
+            points['marker']['size'] = []
+
+        for row in appended:
+            points['x'].append(float(self.store.x[row]))
+            points['y'].append(float(self.store.y[row]))
+            points['z'].append(float(self.store.z[row]))
+            points['marker']['color'].append(str(self.store.colors[row]))
+            points['marker']['size'].append(float(self.store.sizes[row]))
+
+        for row in changed:
+            points['marker']['color'][row] = str(self.store.colors[row])
+            points['marker']['size'][row] = float(self.store.sizes[row])
+
+        if camera_state:
+            patch['layout']['scene']['camera'] = camera_state
+        patch['layout']['uirevision'] = 'noreset'
+        return patch
 
-    def interact_with_point(self, x: float, y: float, z: float) -> None:
-        """Highlight a specific point by changing its color and size"""
+    def interact_with_point(self, x: float, y: float, z: float) -> list[int]:
+        """Highlight a specific point by changing its color and size, returns the changed indices"""
         coord = (x, y, z)
         if coord not in self.coord_dict:
-            return
+            return []
             
         point_idx = self.coord_dict[coord]
         
-        with self.updater:
-            # Create new writable arrays
-            new_colors = np.array(self.points.marker.color, copy=True)
-            new_sizes = np.array(self.points.marker.size, copy=True)
-            
-            # Reset all points to defaults
-            new_colors[:] = self.default_point_color
-            new_sizes[:] = self.default_point_size
-            
-            # Highlight the selected point
-            new_colors[point_idx] = self.default_highlighted_point_color
-            new_sizes[point_idx] = self.default_highlighted_point_size
-            
-            # Update the trace
-            self.points.marker.color = new_colors
-            self.points.marker.size = new_sizes
+        # only the previous and new highlight are touched
+        return self.store.highlight(point_idx)
+
+    def set_lod(self, lod: float) -> None:
+        """Swap the mesh trace for another level of detail, keeping points and layout"""
+        if lod == self.lod:
+            return
+
+        if lod not in Model.LOD_LEVELS:
+            raise ValueError(f'LOD must be one of {Model.LOD_LEVELS}')
+        self.lod = lod
 
     def refresh_model(self, model: Model) -> None:
         """Update the figure with a new LegoModel."""
-        self.figure.data = [model.get_mesh()]  # Replace the mesh
-        # Re-add points or other traces if needed
-        self.figure.add_trace(self.points)
\ No newline at end of file
+        self.__model = model  # the figure is built from it on demand
+        self.lod = Model.FULL_LOD
\ No newline at end of file
@@ -0,0 +1,126 @@
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+
+import numpy as np
+
+# trimesh is only imported once a mesh is actually parsed, hashing stays cheap to import
+if TYPE_CHECKING:
+    import trimesh
+
+# on-disk cache, one directory per source file content hash
+# .cache
+# | <sha256>
+# | | mesh <- entry name
+# | | | vertices.npy, faces.npy, vertex_colors.npy
+# CACHE_PATH moves it (and the bake and figure caches under it) elsewhere, e.g. for benchmarks
+CACHE_PATH: Path = Path(os.environ.get('CACHE_PATH', Path(__file__).parent / ".cache"))
+
+HASH_CHUNK_SIZE: int = 1 << 20
+
+
+def load_mesh(model_path: str) -> 'trimesh.Trimesh':
+    """One flattened mesh, from a scene (glb) or a single-mesh file (ply)"""
+    import trimesh
+    loaded = trimesh.load(model_path)
+    return loaded.to_geometry() if isinstance(loaded, trimesh.Scene) else loaded
+
+
+class MeshCache:
+
+    def __init__(self, cache_path: Path = CACHE_PATH):
+        self._cache_path: Path = Path(cache_path)
+        self.last_hit: Optional[bool] = None
+        self.last_key: Optional[str] = None
+
+    @staticmethod
+    def key(model_path: str) -> str:
+        """Content hash of the source file, so edits invalidate the cache"""
+        digest = hashlib.sha256()
+        with open(model_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def entry_path(self, key: str, name: str) -> Path:
+        return self._cache_path / key / name
+
+    def get_arrays(self, key: str, name: str) -> Optional[dict[str, np.ndarray]]:
+        """Memory-map every array of an entry, or None if it was never stored"""
+        path = self.entry_path(key, name)
+        if not path.is_dir():
+            return None
+
+        return {
+            f.stem: np.load(f, mmap_mode='r')
+            for f in sorted(path.glob('*.npy'))
+        }
+
+    def put_arrays(self, key: str, name: str, arrays: dict[str, np.ndarray]) -> None:
+        """Write an entry atomically so concurrent workers never see half a cache"""
+        path = self.entry_path(key, name)
+        os.makedirs(path.parent, exist_ok=True)
+
+        tmp_path = Path(tempfile.mkdtemp(dir=path.parent, prefix=f'.{name}-'))
+        try:
+            for field, arr in arrays.items():
+                np.save(tmp_path / f'{field}.npy', np.ascontiguousarray(arr))
+            os.replace(tmp_path, path)
+        except OSError:
+            # another worker got there first, theirs is just as good
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            if not path.is_dir():
+                raise
+
+    def get_object(self, key: str, name: str) -> Optional[object]:
+        """Unpickle a derived structure (e.g. a search tree) stored next to the mesh"""
+        path = self._cache_path / key / f'{name}.pkl'
+        if not path.is_file():
+            return None
+
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+            # written by code that no longer matches, rebuilt by the caller
+            print(f"Ignoring unreadable cache entry {path}: {e}")
+            return None
+
+    def put_object(self, key: str, name: str, obj: object) -> None:
+        path = self._cache_path / key / f'{name}.pkl'
+        os.makedirs(path.parent, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{name}-')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def load(self, model_path: str, key: Optional[str] = None) -> 'trimesh.Trimesh':
+        """Load the flattened mesh for `model_path`, parsing the source only on a miss"""
+        import trimesh
+        key = key or self.key(model_path)
+        self.last_key = key
+        arrays = self.get_arrays(key, 'mesh')
+        self.last_hit = arrays is not None
+
+        if arrays is None:
+            mesh_data = load_mesh(model_path)
+            arrays = {
+                'vertices': np.asarray(mesh_data.vertices, dtype=np.float64),
+                'faces': np.asarray(mesh_data.faces, dtype=np.int64)
+            }
+            if mesh_data.visual.kind == 'vertex':
+                arrays['vertex_colors'] = np.asarray(mesh_data.visual.vertex_colors, dtype=np.uint8)
+            self.put_arrays(key, 'mesh', arrays)
+            arrays = self.get_arrays(key, 'mesh')
+
+        return trimesh.Trimesh(
+            vertices=arrays['vertices'],
+            faces=arrays['faces'],
+            vertex_colors=arrays.get('vertex_colors'),
+            process=False
+        )
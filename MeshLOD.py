@@ -0,0 +1,106 @@
+import numpy as np
+
+# grid resolutions tried when searching for a face budget
+MIN_GRID_RESOLUTION: int = 2
+MAX_GRID_RESOLUTION: int = 2048
+
+# part of the cached LOD entry names, bump whenever decimate, its labels or face_labels change output
+LOD_CACHE_VERSION: int = 1
+
+
+def cluster_vertices(vertices: np.ndarray, faces: np.ndarray, resolution: int) -> tuple[np.ndarray, np.ndarray]:
+    """Snap vertices to a uniform grid and return (labels, collapsed faces)"""
+    lo = vertices.min(axis=0)
+    extent = float((vertices.max(axis=0) - lo).max()) or 1.0
+    cells = np.floor((vertices - lo) / extent * resolution).astype(np.int64)
+    np.clip(cells, 0, resolution - 1, out=cells)
+
+    linear = (cells[:, 0] * resolution + cells[:, 1]) * resolution + cells[:, 2]
+    _, labels = np.unique(linear, return_inverse=True)
+    labels = labels.reshape(-1)
+
+    new_faces = labels[faces]
+    keep = (
+        (new_faces[:, 0] != new_faces[:, 1])
+        & (new_faces[:, 1] != new_faces[:, 2])
+        & (new_faces[:, 0] != new_faces[:, 2])
+    )
+    new_faces = new_faces[keep]
+
+    # several triangles can collapse onto the same cluster triple
+    _, first = np.unique(np.sort(new_faces, axis=1), axis=0, return_index=True)
+    return labels, new_faces[np.sort(first)]
+
+
+def decimate(vertices: np.ndarray, faces: np.ndarray, ratio: float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Vertex-clustering decimation down to roughly `ratio` of the faces.
+    Returns (vertices, faces, labels) where labels maps every source vertex
+    to its LOD vertex, or -1 when its cluster was dropped.
+    """
+    vertices = np.asarray(vertices, dtype=np.float64)
+    faces = np.asarray(faces, dtype=np.int64)
+    if ratio >= 1.0 or len(faces) == 0:
+        return vertices, faces, np.arange(len(vertices))
+
+    target = max(1, int(len(faces) * ratio))
+
+    # finest grid that still fits the face budget
+    lo, hi = MIN_GRID_RESOLUTION, MAX_GRID_RESOLUTION
+    labels, new_faces = cluster_vertices(vertices, faces, lo)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        mid_labels, mid_faces = cluster_vertices(vertices, faces, mid)
+        if len(mid_faces) <= target:
+            lo, labels, new_faces = mid, mid_labels, mid_faces
+        else:
+            hi = mid - 1
+
+    # cluster centroids
+    n_clusters = labels.max() + 1
+    counts = np.bincount(labels, minlength=n_clusters)
+    centroids = np.stack([
+        np.bincount(labels, weights=vertices[:, axis], minlength=n_clusters)
+        for axis in range(3)
+    ], axis=1) / counts[:, None]
+
+    # drop clusters no face references anymore
+    used = np.unique(new_faces)
+    remap = np.full(n_clusters, -1, dtype=np.int64)
+    remap[used] = np.arange(len(used))
+
+    return centroids[used], remap[new_faces], remap[labels]
+
+
+def reduce_vertex_attribute(values: np.ndarray, labels: np.ndarray, n_vertices: int) -> np.ndarray:
+    """Average a per-vertex attribute of the source mesh onto LOD vertices"""
+    values = np.asarray(values, dtype=np.float64)
+    mask = labels >= 0
+    counts = np.maximum(np.bincount(labels[mask], minlength=n_vertices), 1)
+    if values.ndim == 1:
+        return np.bincount(labels[mask], weights=values[mask], minlength=n_vertices) / counts
+
+    return np.stack([
+        np.bincount(labels[mask], weights=values[mask, c], minlength=n_vertices)
+        for c in range(values.shape[1])
+    ], axis=1) / counts[:, None]
+
+
+def face_labels(faces: np.ndarray, labels: np.ndarray, lod_faces: np.ndarray) -> np.ndarray:
+    """
+    Map every source face to the LOD face it collapsed onto, or -1 when it collapsed away.
+    Feed the result to reduce_vertex_attribute to average per-face attributes.
+    """
+    source = np.sort(labels[np.asarray(faces, dtype=np.int64)], axis=1)
+    target = np.sort(np.asarray(lod_faces, dtype=np.int64), axis=1)
+    alive = (source >= 0).all(axis=1)
+
+    # one id per distinct vertex triple, shared by LOD faces and the source faces matching them
+    _, ids = np.unique(np.concatenate([target, source[alive]]), axis=0, return_inverse=True)
+    ids = ids.reshape(-1)
+    lookup = np.full(ids.max() + 1, -1, dtype=np.int64)
+    lookup[ids[:len(target)]] = np.arange(len(target))
+
+    out = np.full(len(source), -1, dtype=np.int64)
+    out[alive] = lookup[ids[len(target):]]
+    return out
@@ -0,0 +1,128 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Iterator, Optional
+
+# `1` turns on hot path timing and the /metrics endpoint, off costs one attribute check per timer
+METRICS_ENABLED: bool = os.environ.get('METRICS', '0') == '1'
+
+# seconds, dash callbacks live between a millisecond and a few seconds
+LATENCY_BUCKETS: tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+BYTES_BUCKETS: tuple[float, ...] = tuple(float(256 * 4 ** i) for i in range(10))  # 256B .. 64MiB
+COUNT_BUCKETS: tuple[float, ...] = (0, 1, 10, 100, 1_000, 10_000, 100_000)
+
+_NOOP = nullcontext()
+
+LabelKey = tuple[tuple[str, str], ...]
+
+
+def _format_labels(labels: LabelKey, extra: Optional[tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: tuple[float, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        # per label set: bucket counts (+inf last), sum, count
+        self._series: dict[LabelKey, list] = {}
+
+    def observe(self, value: float, labels: LabelKey = ()) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series.setdefault(labels, [[0] * (len(self.buckets) + 1), 0.0, 0])
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float('inf')), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                lines.append(f'{self.name}_bucket{_format_labels(labels, ("le", le))} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {total:g}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {count}')
+        return lines
+
+
+class Gauge:
+    """Read when scraped, so it never costs anything on the hot path"""
+
+    def __init__(self, name: str, help_text: str, read: Callable[[], float]):
+        self.name = name
+        self.help_text = help_text
+        self.read = read
+
+    def render(self) -> list[str]:
+        return [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} gauge', f'{self.name} {self.read():g}']
+
+
+class Metrics:
+    """
+    Per-process histograms and gauges in the Prometheus text format.
+    With several server workers every worker reports its own numbers.
+    """
+
+    def __init__(self, enabled: bool = METRICS_ENABLED):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._histograms: dict[str, Histogram] = {}
+        self._gauges: dict[str, Gauge] = {}
+
+    def histogram(self, name: str, help_text: str, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = Histogram(name, help_text, buckets)
+            return self._histograms[name]
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], float]) -> None:
+        with self._lock:
+            self._gauges[name] = Gauge(name, help_text, read)
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        if not self.enabled:
+            return
+        histogram = self._histograms[name]
+        with self._lock:
+            histogram.observe(value, tuple(sorted(labels.items())))
+
+    @contextmanager
+    def _timer(self, name: str, labels: dict) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def time(self, name: str, **labels: str):
+        """Context manager adding the block's wall time to a histogram"""
+        return self._timer(name, labels) if self.enabled else _NOOP
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for histogram in self._histograms.values():
+                lines += histogram.render()
+            gauges = list(self._gauges.values())
+        for gauge in gauges:
+            lines += gauge.render()
+        return '\n'.join(lines) + '\n'
+
+
+# shared by every module in the process
+metrics = Metrics()
+metrics.histogram('callback_seconds', 'Dash callback wall time by branch')
+metrics.histogram('interactive_model_seconds', 'Time in InteractiveModel by operation')
+metrics.histogram('updater_seconds', 'Time in InteractiveModelUpdater.__exit__ by step')
+metrics.histogram('request_seconds', 'Dash update request time, callback plus serialization, by branch')
+metrics.histogram('response_bytes', 'Serialized callback response size by branch', BYTES_BUCKETS)
+metrics.histogram('session_markers', 'Markers in the session a callback ran against', COUNT_BUCKETS)
@@ -0,0 +1,149 @@
+import json
+import os
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+
+from ImagePreProcessor import ImagePreprocessor, IMAGE_RESOLUTION_QUALITY, PROCESSING_PRESET
+
+# packed dataset layout
+# dataset
+# | images.u8   <- raw (N, H, W, 3) uint8 rows, appended in place
+# | index.json  <- {"resolution": [H, W], "fig_nums": [...], "generation": n}, fig_nums in row order
+# generation counts writes, rows can be overwritten in place without fig_nums changing
+DATASET_PATH: str = "../minifigs_packed"
+
+IMAGES_FILE: str = "images.u8"
+INDEX_FILE: str = "index.json"
+
+# jpegs decoded per append while converting a directory
+CONVERT_CHUNK: int = 1024
+
+
+class MinifigDataset:
+    """
+    The whole minifig catalog as one memory-mapped uint8 array plus a fig_num -> row index.
+    Reads are views into the page cache, no decode and no copy.
+    """
+
+    def __init__(self, path: str = DATASET_PATH, resolution: tuple[int, int] = IMAGE_RESOLUTION_QUALITY.HIGH.value):
+        self.path = Path(path)
+        os.makedirs(self.path, exist_ok=True)
+
+        index_path = self.path / INDEX_FILE
+        if index_path.exists():
+            with open(index_path) as f:
+                index = json.load(f)
+            self.resolution: tuple[int, int] = tuple(index['resolution'])
+            self.fig_nums: list[str] = index['fig_nums']
+            self.generation: int = index.get('generation', 0)
+        else:
+            self.resolution = tuple(resolution)
+            self.fig_nums = []
+            self.generation = 0
+            (self.path / IMAGES_FILE).touch()
+
+        self.rows: dict[str, int] = {fig_num: row for row, fig_num in enumerate(self.fig_nums)}
+        self._images: Optional[np.memmap] = None
+
+    @property
+    def row_shape(self) -> tuple[int, int, int]:
+        return (*self.resolution, 3)
+
+    @property
+    def images(self) -> np.ndarray:
+        """(N, H, W, 3) read-only memory map of every image"""
+        if self._images is None or len(self._images) != len(self.fig_nums):
+            if not self.fig_nums:
+                return np.empty((0, *self.row_shape), dtype=np.uint8)
+            self._images = np.memmap(
+                self.path / IMAGES_FILE, dtype=np.uint8, mode='r',
+                shape=(len(self.fig_nums), *self.row_shape)
+            )
+        return self._images
+
+    def __len__(self) -> int:
+        return len(self.fig_nums)
+
+    def __contains__(self, fig_num: str) -> bool:
+        return fig_num in self.rows
+
+    def __getitem__(self, fig_num: str) -> np.ndarray:
+        return self.images[self.rows[fig_num]]
+
+    def get_batch(self, fig_nums: Iterable[str]) -> np.ndarray:
+        """Several images at once, a single vectorized gather"""
+        return self.images[[self.rows[f] for f in fig_nums]]
+
+    def _write_index(self) -> None:
+        tmp_path = self.path / f'.{INDEX_FILE}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'resolution': list(self.resolution), 'fig_nums': self.fig_nums, 'generation': self.generation}, f)
+        os.replace(tmp_path, self.path / INDEX_FILE)
+
+    def append(self, fig_nums: list[str], images: np.ndarray) -> None:
+        """Add (or overwrite) images, rows are appended to the end of the file"""
+        images = np.ascontiguousarray(images, dtype=np.uint8)
+        if images.shape[1:] != self.row_shape:
+            raise ValueError(f'Images must be {self.row_shape}, got {images.shape[1:]}')
+        if len(images) != len(fig_nums):
+            raise ValueError(f'Got {len(fig_nums)} fig_nums for {len(images)} images')
+
+        # one row per fig_num, the last copy in this call wins
+        last = {fig_num: i for i, fig_num in enumerate(fig_nums)}
+        if len(last) != len(fig_nums):
+            keep = sorted(last.values())
+            fig_nums = [fig_nums[i] for i in keep]
+            images = images[keep]
+
+        existing = [(i, self.rows[f]) for i, f in enumerate(fig_nums) if f in self.rows]
+        if existing:
+            overwrite = np.memmap(
+                self.path / IMAGES_FILE, dtype=np.uint8, mode='r+',
+                shape=(len(self.fig_nums), *self.row_shape)
+            )
+            for i, row in existing:
+                overwrite[row] = images[i]
+            overwrite.flush()
+
+        new = [i for i, f in enumerate(fig_nums) if f not in self.rows]
+        if new:
+            # rows are written before the index, a crash never indexes missing data
+            with open(self.path / IMAGES_FILE, 'r+b') as f:
+                f.seek(len(self.fig_nums) * int(np.prod(self.row_shape)))
+                f.write(images[new].tobytes())
+                f.truncate()
+            for i in new:
+                self.rows[fig_nums[i]] = len(self.fig_nums)
+                self.fig_nums.append(fig_nums[i])
+
+        self.generation += 1
+        self._write_index()
+        self._images = None
+
+    @classmethod
+    def from_directory(
+        cls,
+        source: str,
+        path: str = DATASET_PATH,
+        preset: PROCESSING_PRESET = PROCESSING_PRESET.BALANCED
+    ) -> 'MinifigDataset':
+        """Pack a directory of `{fig_num}.jpg` files, skipping figures already packed"""
+        dataset = cls(path, preset.resolution)
+        if dataset.resolution != tuple(preset.resolution):
+            raise ValueError(
+                f'{path} is packed at {dataset.resolution}, `{preset.name}` resizes to {preset.resolution}, '
+                f'pick a preset with the same resolution or pack into a new path'
+            )
+        names = sorted(
+            name for name in os.listdir(source)
+            if name.lower().endswith('.jpg') and Path(name).stem not in dataset
+        )
+
+        for start in range(0, len(names), CONVERT_CHUNK):
+            chunk = names[start:start + CONVERT_CHUNK]
+            images = ImagePreprocessor.format_batch((os.path.join(source, name) for name in chunk), preset)
+            dataset.append([Path(name).stem for name in chunk], np.stack([np.asarray(img) for img in images]))
+
+        return dataset
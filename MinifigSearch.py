@@ -0,0 +1,164 @@
+import json
+import os
+from typing import Iterable, Optional
+
+import numpy as np
+
+from ImagePreProcessor import ImagePreprocessor, ImageSource, PROCESSING_PRESET
+from MinifigDataset import MinifigDataset
+
+# features live next to the packed dataset
+FEATURES_FILE: str = "features.npy"
+FEATURES_INDEX_FILE: str = "features.json"
+IVF_FILE: str = "ivf.npz"
+
+HIST_LEVELS: int = 4      # per channel, so 4^3 color bins
+EMBED_BLOCK: int = 8      # 96x96 -> 12x12x3 thumbnail embedding
+HIST_WEIGHT: float = 0.5  # share of the similarity coming from color
+FEATURE_CHUNK: int = 4096
+
+# approximate search: inverted file over k-means cells, probing the closest few
+IVF_MIN_SIZE: int = 50_000
+IVF_PROBES: int = 8
+KMEANS_ITERATIONS: int = 10
+
+
+def compute_features(images: np.ndarray) -> np.ndarray:
+    """(N, H, W, 3) uint8 to L2-normalized float32 features, fully vectorized over the batch"""
+    n, h, w, _ = images.shape
+
+    # color histogram, sqrt'd so dot products behave like the Hellinger kernel
+    levels = (images // (256 // HIST_LEVELS)).astype(np.int64)
+    bins = (levels[..., 0] * HIST_LEVELS + levels[..., 1]) * HIST_LEVELS + levels[..., 2]
+    n_bins = HIST_LEVELS ** 3
+    bins = bins.reshape(n, -1) + np.arange(n)[:, None] * n_bins
+    hist = np.bincount(bins.ravel(), minlength=n * n_bins).reshape(n, n_bins).astype(np.float32)
+    hist = np.sqrt(hist / (h * w))
+
+    # block-averaged thumbnail, mean-centered per image
+    thumb = images.reshape(n, h // EMBED_BLOCK, EMBED_BLOCK, w // EMBED_BLOCK, EMBED_BLOCK, 3)
+    thumb = thumb.mean(axis=(2, 4), dtype=np.float32).reshape(n, -1)
+    thumb -= thumb.mean(axis=1, keepdims=True)
+    thumb /= np.maximum(np.linalg.norm(thumb, axis=1, keepdims=True), 1e-6)
+
+    features = np.hstack([np.sqrt(HIST_WEIGHT) * hist, np.sqrt(1 - HIST_WEIGHT) * thumb])
+    return np.ascontiguousarray(features, dtype=np.float32)
+
+
+def kmeans(features: np.ndarray, k: int, iterations: int = KMEANS_ITERATIONS, seed: int = 0) -> np.ndarray:
+    """Spherical k-means centroids, good enough for coarse IVF cells"""
+    rng = np.random.default_rng(seed)
+    centroids = features[rng.choice(len(features), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(features @ centroids.T, axis=1)
+        for c in range(k):
+            members = features[assignment == c]
+            if len(members):
+                centroid = members.sum(axis=0)
+                centroids[c] = centroid / max(np.linalg.norm(centroid), 1e-6)
+    return centroids
+
+
+class MinifigSearch:
+    """
+    Top-k catalog lookup for a photo or scan frame.
+    Exact search is one matrix product against the contiguous feature matrix;
+    large catalogs can add an inverted file that only scans the closest cells.
+    """
+
+    def __init__(self, dataset: MinifigDataset):
+        self.dataset = dataset
+        self.path = dataset.path
+        self.features: np.ndarray = None
+        self.fig_nums: list[str] = []
+        self.centroids: Optional[np.ndarray] = None
+        self.cells: Optional[list[np.ndarray]] = None
+
+        if not self.load():
+            self.build()
+
+    def load(self) -> bool:
+        index_path = self.path / FEATURES_INDEX_FILE
+        if not index_path.exists():
+            return False
+
+        with open(index_path) as f:
+            index = json.load(f)
+        # the dataset has changed since, rebuild; overwritten rows keep their fig_nums
+        # so the write generation is what tells
+        if index.get('generation') != self.dataset.generation or index['fig_nums'] != self.dataset.fig_nums:
+            return False
+
+        self.fig_nums = index['fig_nums']
+        self.features = np.load(self.path / FEATURES_FILE, mmap_mode='r')
+        if (self.path / IVF_FILE).exists():
+            ivf = np.load(self.path / IVF_FILE)
+            self.centroids = ivf['centroids']
+            assignment = ivf['assignment']
+            self.cells = [np.flatnonzero(assignment == c) for c in range(len(self.centroids))]
+        return True
+
+    def build(self, approximate: Optional[bool] = None) -> None:
+        images = self.dataset.images
+        features = np.empty((len(images), self.feature_size()), dtype=np.float32)
+        for start in range(0, len(images), FEATURE_CHUNK):
+            features[start:start + FEATURE_CHUNK] = compute_features(np.asarray(images[start:start + FEATURE_CHUNK]))
+
+        np.save(self.path / FEATURES_FILE, features)
+        self.features = features
+        self.fig_nums = list(self.dataset.fig_nums)
+
+        if approximate is None:
+            approximate = len(features) >= IVF_MIN_SIZE
+        if approximate and len(features):
+            self.centroids = kmeans(features, k=max(1, int(np.sqrt(len(features)))))
+            assignment = np.argmax(features @ self.centroids.T, axis=1)
+            np.savez(self.path / IVF_FILE, centroids=self.centroids, assignment=assignment)
+            self.cells = [np.flatnonzero(assignment == c) for c in range(len(self.centroids))]
+        elif (self.path / IVF_FILE).exists():
+            os.remove(self.path / IVF_FILE)
+            self.centroids, self.cells = None, None
+
+        with open(self.path / FEATURES_INDEX_FILE, 'w') as f:
+            json.dump({'fig_nums': self.fig_nums, 'generation': self.dataset.generation}, f)
+
+    def feature_size(self) -> int:
+        h, w = self.dataset.resolution
+        return HIST_LEVELS ** 3 + (h // EMBED_BLOCK) * (w // EMBED_BLOCK) * 3
+
+    def query_features(self, queries: np.ndarray, k: int = 5) -> list[list[tuple[str, float]]]:
+        """Top-k (fig_num, cosine similarity) for each row of a (Q, D) feature matrix"""
+        k = min(k, len(self.fig_nums))
+        if k == 0:
+            return [[] for _ in queries]
+
+        if self.centroids is None:
+            scores = queries @ self.features.T
+            candidates = None
+        else:
+            # only score figures in the closest cells of each query
+            probes = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :IVF_PROBES]
+            candidates = [np.concatenate([self.cells[c] for c in row]) for row in probes]
+
+        results = []
+        for q in range(len(queries)):
+            if candidates is None:
+                row_ids, row_scores = None, scores[q]
+            else:
+                row_ids = candidates[q]
+                row_scores = self.features[row_ids] @ queries[q]
+            top = min(k, len(row_scores))
+            if top == 0:
+                results.append([])
+                continue
+            best = np.argpartition(-row_scores, top - 1)[:top]
+            best = best[np.argsort(-row_scores[best])]
+            ids = best if row_ids is None else row_ids[best]
+            results.append([(self.fig_nums[i], float(row_scores[b])) for i, b in zip(ids, best)])
+        return results
+
+    def query(self, sources: Iterable[ImageSource], k: int = 5) -> list[list[tuple[str, float]]]:
+        """Top-k matches for each image (path, bytes or PIL image)"""
+        preset = next(p for p in PROCESSING_PRESET if p.resolution == self.dataset.resolution)
+        images = np.stack([np.asarray(img) for img in ImagePreprocessor.format_batch(sources, preset)])
+        return self.query_features(compute_features(images), k)
@@ -1,19 +1,56 @@
-
-import trimesh
+import numpy as np
 import plotly.graph_objects as go
 
+from MeshCache import MeshCache, load_mesh
+from MeshLOD import LOD_CACHE_VERSION, decimate, face_labels, reduce_vertex_attribute
+from FigureEncoding import encode_figure
+from SpatialIndex import SPATIAL_INDEX_VERSION, SpatialIndex
+
 class Model:
-    
-    def __init__(self, model_path='./assets/lego_man.glb'):
-        
-        # Try loading the 3D model
+
+    # fraction of faces kept per level of detail, finest first
+    LOD_LEVELS: tuple[float, ...] = (1.0, 0.25, 0.05)
+    FULL_LOD: float = LOD_LEVELS[0]
+    COARSE_LOD: float = LOD_LEVELS[-1]
+
+    def __init__(self, model_path='./assets/lego_man.glb', use_cache: bool = True):
+
+        # Try loading the 3D model, from the mesh cache when we can
+        self.cache_hit: bool = False
+        cache = MeshCache() if use_cache else None
         try:
-            scene = trimesh.load(model_path)
-            self.__mesh_data = scene.to_geometry()
+            # content hash of the source, identifies this mesh in every cache
+            self.key: str = MeshCache.key(model_path)
+            if cache:
+                self.__mesh_data = cache.load(model_path, self.key)
+                self.cache_hit = cache.last_hit
+                print(f"Mesh cache {'hit' if self.cache_hit else 'miss'}: {model_path}")
+            else:
+                self.__mesh_data = load_mesh(model_path)
         except Exception as e:
             print(f"Error loading model: {e}")
             raise
 
+        # Per-vertex / per-face RGB once a texture is applied, and reusable UVs
+        self.__vertex_rgb: np.ndarray = None
+        self.__face_rgb: np.ndarray = None
+        self.uv_cache: dict = {}
+
+        # Precompute the LOD ladder, (vertices, faces, labels) per level
+        self.__lods: dict[float, tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        for lod in self.LOD_LEVELS:
+            self.__lods[lod] = self.__load_lod(lod, cache)
+        # source face -> LOD face, only worked out once face colors need carrying over
+        self.__lod_face_labels: dict[float, np.ndarray] = {}
+
+        # Nearest vertex / face lookups for click snapping, cached with the mesh
+        index_name = f'spatial_index.v{SPATIAL_INDEX_VERSION}'
+        self.spatial_index: SpatialIndex = cache.get_object(cache.last_key, index_name) if cache else None
+        if self.spatial_index is None:
+            self.spatial_index = SpatialIndex(self.__mesh_data)
+            if cache:
+                cache.put_object(cache.last_key, index_name, self.spatial_index)
+
         # Create Plotly 3D mesh
         self.__mesh = go.Mesh3d(
             x=self.__mesh_data.vertices[:, 0],
@@ -27,6 +64,9 @@ class Model:
             flatshading=True
         )
 
+        # JSON-ready mesh traces per LOD, typed arrays encoded once for every response
+        self.__client_traces: dict[float, dict] = {}
+
         #A Plotly figure with the 3D mesh
         self.figure = go.Figure(data=[self.__mesh])
         self.figure.update_layout(
@@ -40,18 +80,106 @@ class Model:
             margin=dict(l=0, r=0, b=0, t=30)
         )
 
+        # scans carry their colors per vertex, show those instead of the flat default
+        if self.__mesh_data.visual.kind == 'vertex':
+            self.set_colors(vertex_rgb=np.asarray(self.__mesh_data.visual.vertex_colors)[:, :3])
+
+    def __load_lod(self, lod: float, cache: MeshCache = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # entries carry the code version, stale ones from older code are just never read
+        name = f'lod_{lod:g}.v{LOD_CACHE_VERSION}'
+        if cache and lod != self.FULL_LOD:
+            arrays = cache.get_arrays(cache.last_key, name)
+            if arrays is not None:
+                return arrays['vertices'], arrays['faces'], arrays['labels']
+
+        vertices, faces, labels = decimate(self.__mesh_data.vertices, self.__mesh_data.faces, lod)
+        if cache and lod != self.FULL_LOD:
+            cache.put_arrays(cache.last_key, name, {'vertices': vertices, 'faces': faces, 'labels': labels})
+        return vertices, faces, labels
+
     def get_mesh(self) -> go.Mesh3d:
         return self.__mesh
-    
+
+    def get_lod_mesh(self, lod: float) -> go.Mesh3d:
+        """The current mesh trace, styling included, at a coarser level of detail"""
+        if lod not in self.__lods:
+            raise ValueError(f'LOD must be one of {self.LOD_LEVELS}')
+        if lod == self.FULL_LOD:
+            return self.__mesh
+
+        vertices, faces, labels = self.__lods[lod]
+        mesh = go.Mesh3d(self.__mesh)
+        mesh.update(
+            x=vertices[:, 0], y=vertices[:, 1], z=vertices[:, 2],
+            i=faces[:, 0], j=faces[:, 1], k=faces[:, 2]
+        )
+        mesh.facecolor = None
+        mesh.vertexcolor = None
+
+        # per-vertex colors get averaged over each cluster
+        if self.__vertex_rgb is not None:
+            rgb = reduce_vertex_attribute(self.__vertex_rgb, labels, len(vertices))
+            mesh.vertexcolor = self.to_color_strings(np.rint(rgb).astype(np.uint8))
+
+        # per-face colors over the source faces that collapsed onto each LOD face
+        if self.__face_rgb is not None:
+            if lod not in self.__lod_face_labels:
+                self.__lod_face_labels[lod] = face_labels(self.__mesh_data.faces, labels, faces)
+            rgb = reduce_vertex_attribute(self.__face_rgb, self.__lod_face_labels[lod], len(faces))
+            mesh.facecolor = self.to_color_strings(np.rint(rgb).astype(np.uint8))
+        return mesh
+
+    def get_client_trace(self, lod: float) -> dict:
+        """Mesh trace for the browser, float32 vertices and the narrowest index type, as base64"""
+        trace = self.__client_traces.get(lod)
+        if trace is None:
+            trace = encode_figure({'data': [self.get_lod_mesh(lod).to_plotly_json()]})['data'][0]
+            self.__client_traces[lod] = trace
+        return trace
+
+    @staticmethod
+    def to_color_strings(rgb: np.ndarray) -> np.ndarray:
+        """(N, 3) uint8 RGB to '#rrggbb' strings Plotly understands"""
+        hex_lut = np.array([f'{i:02x}' for i in range(256)])
+        rgb = np.asarray(rgb, dtype=np.uint8)
+        out = np.char.add('#', hex_lut[rgb[:, 0]])
+        out = np.char.add(out, hex_lut[rgb[:, 1]])
+        return np.char.add(out, hex_lut[rgb[:, 2]])
+
+    def set_colors(self, vertex_rgb: np.ndarray = None, face_rgb: np.ndarray = None) -> None:
+        """Recolor the mesh in place, no geometry is rebuilt"""
+        self.__vertex_rgb = vertex_rgb
+        self.__face_rgb = face_rgb
+        vertexcolor = self.to_color_strings(vertex_rgb) if vertex_rgb is not None else None
+        facecolor = self.to_color_strings(face_rgb) if face_rgb is not None else None
+
+        for mesh in (self.__mesh, self.figure.data[0]):
+            mesh.vertexcolor = vertexcolor
+            mesh.facecolor = facecolor
+            mesh.opacity = 1 if vertexcolor is not None or facecolor is not None else 0.5
+        self.__client_traces.clear()
+
+    def get_colors(self) -> tuple[np.ndarray, np.ndarray]:
+        return self.__vertex_rgb, self.__face_rgb
+
+    def snap(self, x: float, y: float, z: float) -> tuple[tuple[float, float, float], int]:
+        """Closest full resolution surface point to a click on any LOD, and its face"""
+        face_id, point = self.spatial_index.nearest_face(x, y, z)
+        return point, face_id
+
+    def snap_to_surface(self, x: float, y: float, z: float) -> tuple[float, float, float]:
+        """Map a point picked on any LOD onto the full resolution surface"""
+        return self.snap(x, y, z)[0]
+
     def update_figure(self, mesh: go.Mesh3d):
         if not isinstance(mesh, go.Mesh3d):
             raise TypeError('Mesh must be a go.Mesh3d type')
-        
+
         self.__mesh = mesh
         self.figure = go.Figure(data=[self.__mesh])
-    
+        self.__client_traces.clear()
+
     def get_mesh_data(self):
         return self.__mesh_data
-    
 
-    
\ No newline at end of file
+
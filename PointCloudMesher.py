@@ -0,0 +1,215 @@
+import os
+from enum import Enum
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterator, Optional
+
+import numpy as np
+
+# open3d is only imported to mesh, the queue and capture paths never need it
+if TYPE_CHECKING:
+    import open3d as o3d
+
+# points read per chunk while streaming the ply, memory is bounded by voxels not points
+READ_CHUNK: int = 1_000_000
+# voxel edge as a fraction of the cloud's largest extent when none is given
+VOXEL_RESOLUTION: int = 256
+
+OUTLIER_NEIGHBORS: int = 20
+OUTLIER_STD_RATIO: float = 2.0
+
+POISSON_DEPTH: int = 9
+# poisson extrapolates a hull around sparse areas, drop its least supported vertices
+POISSON_DENSITY_QUANTILE: float = 0.02
+NORMAL_NEIGHBORS: int = 30
+
+FACE_BUDGET: int = 100_000
+MESH_FILE_NAME: str = "mesh.ply"
+
+PLY_TYPES: dict[str, str] = {
+    'char': 'i1', 'int8': 'i1', 'uchar': 'u1', 'uint8': 'u1',
+    'short': 'i2', 'int16': 'i2', 'ushort': 'u2', 'uint16': 'u2',
+    'int': 'i4', 'int32': 'i4', 'uint': 'u4', 'uint32': 'u4',
+    'float': 'f4', 'float32': 'f4', 'double': 'f8', 'float64': 'f8',
+}
+
+# voxel coordinates are packed into one int64, 21 bits per axis
+VOXEL_BITS: int = 21
+VOXEL_OFFSET: int = 1 << (VOXEL_BITS - 1)
+
+
+class Reconstruction(Enum):
+    POISSON: str = 'poisson'
+    BALL_PIVOTING: str = 'ball_pivoting'
+
+
+def read_ply_header(f) -> tuple[np.dtype, int]:
+    """Vertex record dtype and count of a binary ply, leaves `f` at the first vertex"""
+    if f.readline().strip() != b'ply':
+        raise ValueError("Not a ply file")
+
+    byte_order, count, fields, in_vertex = '<', 0, [], False
+    while True:
+        line = f.readline()
+        if not line:
+            raise ValueError("Truncated ply header")
+        words = line.decode('ascii').split()
+        if not words:
+            continue
+        if words[0] == 'end_header':
+            break
+        if words[0] == 'format':
+            if words[1] == 'ascii':
+                raise ValueError("Only binary ply files can be streamed")
+            byte_order = '<' if words[1] == 'binary_little_endian' else '>'
+        elif words[0] == 'element':
+            in_vertex = words[1] == 'vertex'
+            if in_vertex:
+                count = int(words[2])
+        elif words[0] == 'property' and in_vertex:
+            if words[1] == 'list':
+                raise ValueError("List properties on vertices are not supported")
+            fields.append((words[2], byte_order + PLY_TYPES[words[1]]))
+
+    return np.dtype(fields), count
+
+
+def stream_ply(path: Path, chunk: int = READ_CHUNK) -> Iterator[np.ndarray]:
+    """Vertex records of a binary ply, `chunk` at a time"""
+    with open(path, 'rb') as f:
+        dtype, count = read_ply_header(f)
+        for start in range(0, count, chunk):
+            records = np.fromfile(f, dtype=dtype, count=min(chunk, count - start))
+            if len(records) == 0:
+                break
+            yield records
+
+
+class VoxelAccumulator:
+    """Running per-voxel sums of positions, normals and colors, merged chunk by chunk"""
+
+    def __init__(self, voxel_size: float):
+        self.voxel_size = voxel_size
+        self.keys = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.int64)
+        self.sums: dict[str, np.ndarray] = {}
+
+    def add(self, records: np.ndarray) -> None:
+        names = records.dtype.names
+        xyz = np.stack([records['x'], records['y'], records['z']], axis=1).astype(np.float64)
+        values = {'xyz': xyz}
+        if 'nx' in names:
+            values['normals'] = np.stack([records['nx'], records['ny'], records['nz']], axis=1).astype(np.float64)
+        if 'red' in names:
+            values['colors'] = np.stack([records['red'], records['green'], records['blue']], axis=1).astype(np.float64)
+
+        cells = np.floor(xyz / self.voxel_size).astype(np.int64) + VOXEL_OFFSET
+        np.clip(cells, 0, (1 << VOXEL_BITS) - 1, out=cells)
+        keys = (cells[:, 0] << (2 * VOXEL_BITS)) | (cells[:, 1] << VOXEL_BITS) | cells[:, 2]
+
+        # merge the chunk into what we have so far in one unique + bincount pass
+        n_known = len(self.keys)
+        self.keys, labels = np.unique(np.concatenate([self.keys, keys]), return_inverse=True)
+        labels = labels.reshape(-1)
+        n = len(self.keys)
+
+        counts = np.concatenate([self.counts, np.ones(len(keys), dtype=np.int64)])
+        self.counts = np.bincount(labels, weights=counts, minlength=n).astype(np.int64)
+        for name, value in values.items():
+            stacked = np.concatenate([self.sums.get(name, np.zeros((n_known, 3))), value])
+            self.sums[name] = np.stack([
+                np.bincount(labels, weights=stacked[:, axis], minlength=n)
+                for axis in range(3)
+            ], axis=1)
+
+    def means(self) -> dict[str, np.ndarray]:
+        return {name: total / self.counts[:, None] for name, total in self.sums.items()}
+
+
+def cloud_bounds(path: Path) -> tuple[np.ndarray, np.ndarray]:
+    lo, hi = np.full(3, np.inf), np.full(3, -np.inf)
+    for records in stream_ply(path):
+        xyz = np.stack([records['x'], records['y'], records['z']], axis=1)
+        lo = np.minimum(lo, xyz.min(axis=0))
+        hi = np.maximum(hi, xyz.max(axis=0))
+    return lo, hi
+
+
+def downsample(path: Path, voxel_size: Optional[float] = None) -> tuple['o3d.geometry.PointCloud', float]:
+    """Stream a fused ply into a voxel-averaged open3d cloud"""
+    import open3d as o3d
+    if voxel_size is None:
+        lo, hi = cloud_bounds(path)
+        if not np.all(np.isfinite(lo)):
+            raise ValueError(f"{path} has no points")
+        voxel_size = float((hi - lo).max()) / VOXEL_RESOLUTION or 1.0
+
+    accumulator = VoxelAccumulator(voxel_size)
+    for records in stream_ply(path):
+        accumulator.add(records)
+    means = accumulator.means()
+
+    pcd = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(means['xyz']))
+    if 'normals' in means:
+        normals = means['normals']
+        normals /= np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-12)
+        pcd.normals = o3d.utility.Vector3dVector(normals)
+    if 'colors' in means:
+        pcd.colors = o3d.utility.Vector3dVector(np.clip(means['colors'] / 255.0, 0, 1))
+    return pcd, voxel_size
+
+
+def reconstruct(
+    pcd: 'o3d.geometry.PointCloud',
+    voxel_size: float,
+    method: Reconstruction = Reconstruction.POISSON,
+    face_budget: int = FACE_BUDGET
+) -> 'o3d.geometry.TriangleMesh':
+    import open3d as o3d
+    pcd, _ = pcd.remove_statistical_outlier(nb_neighbors=OUTLIER_NEIGHBORS, std_ratio=OUTLIER_STD_RATIO)
+    if len(pcd.points) < 4:
+        raise ValueError("Too few points left to reconstruct a surface")
+
+    if not pcd.has_normals():
+        pcd.estimate_normals(o3d.geometry.KDTreeSearchParamKNN(NORMAL_NEIGHBORS))
+        pcd.orient_normals_consistent_tangent_plane(NORMAL_NEIGHBORS)
+
+    if method == Reconstruction.POISSON:
+        mesh, densities = o3d.geometry.TriangleMesh.create_from_point_cloud_poisson(pcd, depth=POISSON_DEPTH)
+        densities = np.asarray(densities)
+        mesh.remove_vertices_by_mask(densities < np.quantile(densities, POISSON_DENSITY_QUANTILE))
+    else:
+        radii = o3d.utility.DoubleVector([voxel_size * 1.5, voxel_size * 3, voxel_size * 6])
+        mesh = o3d.geometry.TriangleMesh.create_from_point_cloud_ball_pivoting(pcd, radii)
+
+    if len(mesh.triangles) > face_budget:
+        mesh = mesh.simplify_quadric_decimation(target_number_of_triangles=face_budget)
+    mesh.remove_degenerate_triangles()
+    mesh.remove_unreferenced_vertices()
+    return mesh
+
+
+def mesh_scan(
+    fused_path: Path,
+    output_path: Optional[Path] = None,
+    method: Reconstruction = Reconstruction.POISSON,
+    face_budget: int = FACE_BUDGET,
+    voxel_size: Optional[float] = None
+) -> Path:
+    """
+    `dense/fused.ply` to a colored triangle mesh `Model` can load, next to the scan.
+    Skipped when the mesh is already newer than the cloud.
+    """
+    import open3d as o3d
+    fused_path = Path(fused_path)
+    output_path = Path(output_path) if output_path else fused_path.parent.parent / MESH_FILE_NAME
+    if output_path.exists() and output_path.stat().st_mtime >= fused_path.stat().st_mtime:
+        return output_path
+
+    pcd, voxel_size = downsample(fused_path, voxel_size)
+    mesh = reconstruct(pcd, voxel_size, method, face_budget)
+
+    tmp_path = output_path.with_name(f".{output_path.name}.tmp.ply")
+    if not o3d.io.write_triangle_mesh(str(tmp_path), mesh, write_vertex_colors=True):
+        raise IOError(f"Could not write {output_path}")
+    os.replace(tmp_path, output_path)
+    return output_path
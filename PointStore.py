@@ -0,0 +1,167 @@
+import numpy as np
+from typing import Hashable, Optional
+
+class PointStore:
+    """
+    Struct-of-arrays marker storage with amortized O(1) append.
+    Arrays grow by doubling and are exposed as read-only views of the live rows.
+    """
+
+    initial_capacity = 64
+    color_dtype = np.dtype('<U32')
+
+    def __init__(self, default_color: str, default_size: float,
+                 highlighted_color: str, highlighted_size: float):
+        self.default_color = default_color
+        self.default_size = default_size
+        self.highlighted_color = highlighted_color
+        self.highlighted_size = highlighted_size
+
+        # key (e.g. rounded xyz) -> row, and row -> key for compaction
+        self.index: dict[Hashable, int] = {}
+        self._keys: list[Hashable] = []
+        self.highlighted: Optional[int] = None
+
+        # rows written since the last take_changes(), and the size the store had then
+        self._dirty: set[int] = set()
+        self._flushed_size = 0
+
+        self._size = 0
+        self._allocate(self.initial_capacity)
+
+    def _allocate(self, capacity: int) -> None:
+        old = getattr(self, '_xyz', None)
+        xyz = np.empty((capacity, 3), dtype=float)
+        colors = np.empty(capacity, dtype=self.color_dtype)
+        sizes = np.empty(capacity, dtype=float)
+        face_ids = np.empty(capacity, dtype=np.int64)
+
+        if old is not None:
+            xyz[:self._size] = self._xyz[:self._size]
+            colors[:self._size] = self._colors[:self._size]
+            sizes[:self._size] = self._sizes[:self._size]
+            face_ids[:self._size] = self._face_ids[:self._size]
+
+        self._xyz, self._colors, self._sizes, self._face_ids = xyz, colors, sizes, face_ids
+
+    @staticmethod
+    def _view(arr: np.ndarray) -> np.ndarray:
+        view = arr.view()
+        view.flags.writeable = False
+        return view
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.index
+
+    @property
+    def x(self) -> np.ndarray:
+        return self._view(self._xyz[:self._size, 0])
+
+    @property
+    def y(self) -> np.ndarray:
+        return self._view(self._xyz[:self._size, 1])
+
+    @property
+    def z(self) -> np.ndarray:
+        return self._view(self._xyz[:self._size, 2])
+
+    @property
+    def colors(self) -> np.ndarray:
+        return self._view(self._colors[:self._size])
+
+    @property
+    def sizes(self) -> np.ndarray:
+        return self._view(self._sizes[:self._size])
+
+    @property
+    def face_ids(self) -> np.ndarray:
+        """Mesh face each point sits on, -1 when unknown"""
+        return self._view(self._face_ids[:self._size])
+
+    def append(self, key: Hashable, x: float, y: float, z: float, face_id: int = -1) -> int:
+        """Add a point and return its row, or the existing row for a known key"""
+        if key in self.index:
+            return self.index[key]
+
+        if self._size == len(self._sizes):
+            self._allocate(2 * len(self._sizes))
+
+        row = self._size
+        self._xyz[row] = (x, y, z)
+        self._colors[row] = self.default_color
+        self._sizes[row] = self.default_size
+        self._face_ids[row] = face_id
+        self._size += 1
+        self._dirty.add(row)
+
+        self.index[key] = row
+        self._keys.append(key)
+        return row
+
+    def highlight(self, row: int) -> list[int]:
+        """Highlight one row, returning the rows whose marker changed"""
+        changed = self.unhighlight()
+        self._colors[row] = self.highlighted_color
+        self._sizes[row] = self.highlighted_size
+        self.highlighted = row
+        return changed + [row]
+
+    def unhighlight(self) -> list[int]:
+        if self.highlighted is None:
+            return []
+
+        row = self.highlighted
+        self._colors[row] = self.default_color
+        self._sizes[row] = self.default_size
+        self.highlighted = None
+        return [row]
+
+    def remove(self, key: Hashable) -> Optional[int]:
+        """Remove a point by moving the last row into its slot, returning the moved-from row"""
+        row = self.index.pop(key, None)
+        if row is None:
+            return None
+
+        last = self._size - 1
+        if self.highlighted == row:
+            self.highlighted = None
+
+        if row != last:
+            self._xyz[row] = self._xyz[last]
+            self._colors[row] = self._colors[last]
+            self._sizes[row] = self._sizes[last]
+            self._face_ids[row] = self._face_ids[last]
+
+            self._dirty.add(row)
+
+            moved_key = self._keys[last]
+            self._keys[row] = moved_key
+            self.index[moved_key] = row
+            if self.highlighted == last:
+                self.highlighted = row
+
+        self._keys.pop()
+        self._size -= 1
+        self._dirty.discard(last)
+        return last
+
+    def clear(self) -> None:
+        self.index.clear()
+        self._keys.clear()
+        self.highlighted = None
+        self._size = 0
+        self._dirty.clear()
+
+    def take_changes(self) -> tuple[list[int], int]:
+        """
+        Rows written since the last call and the size the store had then, for persisting
+        only what changed. Rows at or past the current size are gone when the store shrank.
+        """
+        rows = sorted(row for row in self._dirty if row < self._size)
+        flushed_size = self._flushed_size
+        self._dirty.clear()
+        self._flushed_size = self._size
+        return rows, flushed_size
@@ -0,0 +1,254 @@
+import os
+import sqlite3
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+from ColmapPipeline import ColmapInterrupted, ColmapPipeline, StageLimits
+from MeshCache import MeshCache
+from PointCloudMesher import FACE_BUDGET, Reconstruction, mesh_scan
+
+# file structure styled db, one folder per scan
+# workspace
+# | jobs.db
+# | id
+# | | images
+# | | sparse, dense, pipeline_state.json, run_report.json
+# | | mesh.ply <- what the viewer loads
+WORKSPACE: Path = Path(__file__).parent / "scans"
+
+JOBS_FILE: str = "jobs.db"
+IMG_DIR_NAME: str = "images"
+
+POLL_INTERVAL: float = 2.0
+
+
+@dataclass
+class ScanJob:
+    scan_id: str
+    state: str = 'pending'  # pending | running | done | failed
+    attempts: int = 0
+    error: Optional[str] = None
+    worker_pid: Optional[int] = None
+    queued_at: Optional[float] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class ScanQueue:
+    """
+    Persistent queue of scan reconstructions over `workspace/<id>/`.
+    Capture only enqueues, a separate worker process drains the queue with a
+    fixed number of concurrent pipelines. Jobs left running by a dead worker
+    go back to pending and resume from their last finished COLMAP stage.
+    """
+
+    def __init__(
+        self,
+        workspace: Path = WORKSPACE,
+        method: Reconstruction = Reconstruction.POISSON,
+        face_budget: int = FACE_BUDGET
+    ):
+        self.workspace = Path(workspace)
+        self.method = method
+        self.face_budget = face_budget
+        os.makedirs(self.workspace, exist_ok=True)
+        self._conn = sqlite3.connect(self.workspace / JOBS_FILE, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'scan_id TEXT PRIMARY KEY, state TEXT, attempts INTEGER, error TEXT, '
+                'worker_pid INTEGER, queued_at REAL, started_at REAL, finished_at REAL)'
+            )
+            self._conn.commit()
+
+    def collection_path(self, scan_id: str) -> Path:
+        return self.workspace / scan_id / IMG_DIR_NAME
+
+    def enqueue(self, scan_id: str, force: bool = False) -> None:
+        """Queue a scan, `force` also requeues one that already finished or failed"""
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR IGNORE INTO jobs (scan_id, state, attempts, queued_at) VALUES (?, ?, 0, ?)',
+                (scan_id, 'pending', time.time())
+            )
+            if force:
+                self._conn.execute(
+                    "UPDATE jobs SET state = 'pending', error = NULL, queued_at = ? "
+                    "WHERE scan_id = ? AND state IN ('done', 'failed')",
+                    (time.time(), scan_id)
+                )
+            self._conn.commit()
+
+    def discover(self) -> list[str]:
+        """Queue every scan folder with images that has no job yet"""
+        with self._lock:
+            known = {row[0] for row in self._conn.execute('SELECT scan_id FROM jobs')}
+        found = sorted(
+            entry.name for entry in self.workspace.iterdir()
+            if entry.name not in known and (entry / IMG_DIR_NAME).is_dir()
+        )
+        for scan_id in found:
+            self.enqueue(scan_id)
+        return found
+
+    def recover(self) -> list[str]:
+        """Requeue running jobs whose worker process is gone"""
+        with self._lock:
+            running = self._conn.execute(
+                "SELECT scan_id, worker_pid FROM jobs WHERE state = 'running'"
+            ).fetchall()
+            orphaned = [scan_id for scan_id, pid in running if pid is None or not _pid_alive(pid)]
+            self._conn.executemany(
+                "UPDATE jobs SET state = 'pending', worker_pid = NULL WHERE scan_id = ?",
+                [(scan_id,) for scan_id in orphaned]
+            )
+            self._conn.commit()
+        return orphaned
+
+    def claim(self) -> Optional[str]:
+        """Atomically take the oldest pending scan, safe across worker processes"""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            row = self._conn.execute(
+                "SELECT scan_id FROM jobs WHERE state = 'pending' ORDER BY queued_at LIMIT 1"
+            ).fetchone()
+            if row:
+                self._conn.execute(
+                    "UPDATE jobs SET state = 'running', attempts = attempts + 1, worker_pid = ?, "
+                    "started_at = ?, finished_at = NULL WHERE scan_id = ?",
+                    (os.getpid(), time.time(), row[0])
+                )
+            self._conn.commit()
+        return row[0] if row else None
+
+    def requeue(self, scan_id: str) -> None:
+        """Put an interrupted job back, the interruption doesn't count as an attempt"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = 'pending', worker_pid = NULL, attempts = MAX(attempts - 1, 0) "
+                "WHERE scan_id = ?",
+                (scan_id,)
+            )
+            self._conn.commit()
+
+    def finish(self, scan_id: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                'UPDATE jobs SET state = ?, error = ?, worker_pid = NULL, finished_at = ? WHERE scan_id = ?',
+                ('failed' if error else 'done', error, time.time(), scan_id)
+            )
+            self._conn.commit()
+
+    def jobs(self, state: Optional[str] = None) -> list[ScanJob]:
+        query = ('SELECT scan_id, state, attempts, error, worker_pid, queued_at, started_at, finished_at '
+                 'FROM jobs')
+        params = ()
+        if state:
+            query += ' WHERE state = ?'
+            params = (state,)
+        with self._lock:
+            rows = self._conn.execute(query + ' ORDER BY queued_at', params).fetchall()
+        return [ScanJob(*row) for row in rows]
+
+    def process(
+        self,
+        scan_id: str,
+        limits: Optional[dict[str, StageLimits]] = None,
+        cancel: Optional[threading.Event] = None
+    ) -> Path:
+        """COLMAP, then the fused cloud to a mesh, returns the mesh path"""
+        fused_path = ColmapPipeline(self.collection_path(scan_id), limits=limits, cancel=cancel).run()
+        mesh_path = mesh_scan(fused_path, method=self.method, face_budget=self.face_budget)
+        # parse it into the mesh cache now so the viewer opens it straight from there
+        MeshCache().load(str(mesh_path))
+        return mesh_path
+
+    def run(
+        self,
+        concurrency: int = 1,
+        limits: Optional[dict[str, StageLimits]] = None,
+        watch: bool = False,
+        on_done: Optional[Callable[[str, Optional[Path], Optional[Exception]], None]] = None,
+        stop: Optional[threading.Event] = None
+    ) -> None:
+        """
+        Drain the queue with `concurrency` pipelines at once.
+        With `watch` it keeps polling for new scans until `stop` is set.
+        Setting `stop` (or Ctrl-C) ends running scans at their next COLMAP stage
+        and puts them back in the queue, they resume from there on the next run.
+        """
+        stop = stop or threading.Event()
+        self.recover()
+
+        def worker() -> None:
+            while not stop.is_set():
+                scan_id = self.claim()
+                if scan_id is None:
+                    if not watch:
+                        return
+                    self.discover()
+                    stop.wait(POLL_INTERVAL)
+                    continue
+
+                print(f"Reconstructing scan {scan_id}...")
+                try:
+                    mesh_path = self.process(scan_id, limits, cancel=stop)
+                except ColmapInterrupted as e:
+                    # Ctrl-C reaches the colmap children too, that is no failure
+                    print(f"Scan {scan_id} interrupted at {e.stage}, back in the queue")
+                    stop.set()
+                    self.requeue(scan_id)
+                    continue
+                except Exception as e:
+                    print(f"Scan {scan_id} failed: {e}")
+                    self.finish(scan_id, error=str(e))
+                    if on_done:
+                        on_done(scan_id, None, e)
+                    continue
+                self.finish(scan_id)
+                if on_done:
+                    on_done(scan_id, mesh_path, None)
+
+        def guarded_worker() -> None:
+            try:
+                worker()
+            except BaseException:
+                # e.g. `database is locked` from claim, wind the other workers down too
+                print(f"Scan worker crashed:\n{traceback.format_exc()}")
+                stop.set()
+                raise
+
+        pool = ThreadPoolExecutor(max_workers=concurrency)
+        futures = [pool.submit(guarded_worker) for _ in range(concurrency)]
+        try:
+            done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in done:
+                future.result()
+        except KeyboardInterrupt:
+            print("Stopping, running scans go back to the queue...")
+            stop.set()
+            raise
+        finally:
+            # running scans stop at their next stage, wait for them to be requeued
+            pool.shutdown(wait=True)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -3,19 +3,22 @@ from typing import Optional
 from Model import Model
 from InteractiveModel import InteractiveModel
 from TextureMapper import TextureMapper
+from BakeCache import BakeCache
 
 class SceneBuilder:
     def __init__(
         self,
         model_path: str = './assets/lego_man.glb',
-        texture_path: Optional[str] = None
+        texture_path: Optional[str] = None,
+        bake_cache: Optional[BakeCache] = None
     ):
         self.model = Model(model_path)
         self.texture_mapper = TextureMapper(texture_path) if texture_path else None
+        self.bake_cache = bake_cache or BakeCache()
         
-        # Apply texture before making it interactive 
+        # Apply texture before making it interactive, baked colors come from the cache when we can
         if self.texture_mapper:
-            self.texture_mapper.apply_texture(self.model)
+            self.texture_mapper.apply_texture(self.model, self.bake_cache)
 
         self.interactive_model = InteractiveModel(self.model)
 
@@ -0,0 +1,310 @@
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Optional, TypeVar, Union
+
+from Model import Model
+from InteractiveModel import InteractiveModel
+
+# `memory` or `sqlite:<path>`, the sqlite store is shared by every worker on the box
+SESSION_STORE: str = os.environ.get('SESSION_STORE', 'memory')
+
+# seconds without a callback before a session is dropped, every page load starts a new one
+SESSION_TTL: float = float(os.environ.get('SESSION_TTL', 24 * 60 * 60))
+# how often a worker sweeps the store for expired sessions
+SESSION_SWEEP_INTERVAL: float = 60.0
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+class SessionStore(ABC):
+    """
+    Where per-session annotation state lives, outside of any one worker.
+    A session is a header (version, lod, highlighted row, size) plus one record per marker row,
+    so a callback writes back only the rows it touched.
+    """
+
+    @abstractmethod
+    def version(self, session_id: str) -> int:
+        """Current version of a session, 0 when there is none"""
+
+    @abstractmethod
+    def load(self, session_id: str) -> Optional[dict]:
+        """Whole session in `InteractiveModel.from_state` form plus its `version`"""
+
+    @abstractmethod
+    def save(self, session_id: str, version: int, changes: dict) -> bool:
+        """
+        Apply `InteractiveModel.take_changes()` and bump the version, only if the session is
+        still at `version`. Returns False when another writer got there first.
+        """
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def expire(self, max_age: float) -> int:
+        """Drop sessions not written for `max_age` seconds, returns how many"""
+
+
+class MemorySessionStore(SessionStore):
+    """Single process only, handy for development"""
+
+    def __init__(self):
+        # session id -> {version, lod, highlighted, points, updated}
+        self._sessions: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def version(self, session_id: str) -> int:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return session['version'] if session else 0
+
+    def load(self, session_id: str) -> Optional[dict]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            return {
+                'version': session['version'],
+                'lod': session['lod'],
+                'highlighted': session['highlighted'],
+                'points': [list(point) for point in session['points']]
+            }
+
+    def save(self, session_id: str, version: int, changes: dict) -> bool:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if (session['version'] if session else 0) != version:
+                return False
+            if session is None:
+                session = self._sessions[session_id] = {'points': []}
+
+            points = session['points']
+            for row, *point in changes['points']:
+                if row < len(points):
+                    points[row] = point
+                else:
+                    points.append(point)
+            del points[changes['size']:]
+
+            session.update(
+                version=version + 1, lod=changes['lod'], highlighted=changes['highlighted'], updated=time.time()
+            )
+            return True
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def expire(self, max_age: float) -> int:
+        cutoff = time.time() - max_age
+        with self._lock:
+            expired = [session_id for session_id, session in self._sessions.items() if session['updated'] < cutoff]
+            for session_id in expired:
+                del self._sessions[session_id]
+        return len(expired)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Local file store, safe to share between worker processes"""
+
+    def __init__(self, path: str):
+        self._path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, version INTEGER NOT NULL, '
+                'lod REAL NOT NULL, highlighted INTEGER, size INTEGER NOT NULL, updated REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS markers (session TEXT NOT NULL, row INTEGER NOT NULL, '
+                'x REAL NOT NULL, y REAL NOT NULL, z REAL NOT NULL, face_id INTEGER NOT NULL, '
+                'PRIMARY KEY (session, row)) WITHOUT ROWID'
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite connections can't hop threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=30)
+            self._local.conn = conn
+        return conn
+
+    def version(self, session_id: str) -> int:
+        row = self._connect().execute('SELECT version FROM sessions WHERE id = ?', (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    def load(self, session_id: str) -> Optional[dict]:
+        # one read transaction, so the markers match the header's version
+        with self._connect() as conn:
+            conn.execute('BEGIN')
+            header = conn.execute(
+                'SELECT version, lod, highlighted, size FROM sessions WHERE id = ?', (session_id,)
+            ).fetchone()
+            if header is None:
+                return None
+            version, lod, highlighted, size = header
+            points = conn.execute(
+                'SELECT x, y, z, face_id FROM markers WHERE session = ? AND row < ? ORDER BY row', (session_id, size)
+            ).fetchall()
+        return {'version': version, 'lod': lod, 'highlighted': highlighted, 'points': [list(p) for p in points]}
+
+    def save(self, session_id: str, version: int, changes: dict) -> bool:
+        # the write lock is only held for this delta, never while a callback computes
+        header = (changes['lod'], changes['highlighted'], changes['size'], time.time())
+        with self._connect() as conn:
+            if version == 0:
+                cursor = conn.execute(
+                    'INSERT OR IGNORE INTO sessions (lod, highlighted, size, updated, id, version) '
+                    'VALUES (?, ?, ?, ?, ?, 1)', (*header, session_id)
+                )
+            else:
+                cursor = conn.execute(
+                    'UPDATE sessions SET version = version + 1, lod = ?, highlighted = ?, size = ?, updated = ? '
+                    'WHERE id = ? AND version = ?', (*header, session_id, version)
+                )
+            if cursor.rowcount == 0:
+                return False
+
+            conn.executemany(
+                'INSERT OR REPLACE INTO markers (session, row, x, y, z, face_id) VALUES (?, ?, ?, ?, ?, ?)',
+                ((session_id, *point) for point in changes['points'])
+            )
+            if changes['size'] < changes['flushed_size']:
+                conn.execute('DELETE FROM markers WHERE session = ? AND row >= ?', (session_id, changes['size']))
+        return True
+
+    def delete(self, session_id: str) -> None:
+        with self._connect() as conn:
+            conn.execute('DELETE FROM markers WHERE session = ?', (session_id,))
+            conn.execute('DELETE FROM sessions WHERE id = ?', (session_id,))
+
+    def expire(self, max_age: float) -> int:
+        cutoff = time.time() - max_age
+        with self._connect() as conn:
+            conn.execute(
+                'DELETE FROM markers WHERE session IN (SELECT id FROM sessions WHERE updated < ?)', (cutoff,)
+            )
+            return conn.execute('DELETE FROM sessions WHERE updated < ?', (cutoff,)).rowcount
+
+
+def make_session_store(spec: str = SESSION_STORE) -> SessionStore:
+    if spec == 'memory':
+        return MemorySessionStore()
+    if spec.startswith('sqlite:'):
+        return SQLiteSessionStore(spec[len('sqlite:'):])
+    raise ValueError(f'Unknown session store `{spec}`')
+
+
+class SessionManager:
+    """
+    Hands out one InteractiveModel per session over a shared read-only Model.
+    The store is the source of truth; live models are kept per worker and
+    rebuilt whenever another worker has written a newer version.
+    """
+
+    max_live_sessions = 64
+    # optimistic writes retried before a callback gives up
+    max_conflict_retries = 16
+
+    def __init__(self, model: Model, store: SessionStore, ttl: float = SESSION_TTL):
+        self.model = model
+        self.store = store
+        self.ttl = ttl
+        self._live: OrderedDict[str, tuple[int, InteractiveModel]] = OrderedDict()
+        self._locks: dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+
+    def _sweep(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_sweep:
+                return
+            self._next_sweep = now + SESSION_SWEEP_INTERVAL
+        expired = self.store.expire(self.ttl)
+        if expired:
+            print(f"Expired {expired} idle session(s)")
+
+    def _session_lock(self, session_id: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(session_id, threading.Lock())
+
+    def update(
+        self,
+        session_id: str,
+        change: Callable[[InteractiveModel], T],
+        respond: Optional[Callable[[InteractiveModel, T], R]] = None
+    ) -> Union[T, R]:
+        """
+        Apply `change` to a session's InteractiveModel and persist only what it changed.
+        Nothing in the store is locked while `change` runs: the write lands only if no other
+        worker wrote the session meanwhile, otherwise the session is reloaded and `change` runs again.
+        `respond` builds the response from the committed model, it runs once and after the write.
+        """
+        self._sweep()
+        # the thread lock orders this worker's callbacks for the session, versions other workers'
+        with self._session_lock(session_id):
+            for _ in range(self.max_conflict_retries):
+                interactive_model, version = self._load(session_id)
+                saved = False
+                try:
+                    result = change(interactive_model)
+                    saved = self.store.save(session_id, version, interactive_model.take_changes())
+                finally:
+                    # unsaved, the live copy is ahead of the store and is reloaded next time
+                    if not saved:
+                        self._drop_live(session_id)
+
+                if saved:
+                    self._keep_live(session_id, version + 1, interactive_model)
+                    return respond(interactive_model, result) if respond else result
+
+        print(f"Session {session_id} kept changing under {self.max_conflict_retries} attempts")
+        raise RuntimeError(f'Too many concurrent writes to session {session_id}')
+
+    def _load(self, session_id: str) -> tuple[InteractiveModel, int]:
+        version = self.store.version(session_id)
+        with self._lock:
+            live = self._live.get(session_id)
+        if live and live[0] == version:
+            return live[1], version
+
+        state = self.store.load(session_id)
+        if state:
+            interactive_model = InteractiveModel.from_state(self.model, state)
+            version = state['version']
+        else:
+            interactive_model = InteractiveModel(self.model)
+            interactive_model.set_lod(Model.COARSE_LOD)
+            version = 0
+        # what was just loaded is already stored
+        interactive_model.take_changes()
+        return interactive_model, version
+
+    def _drop_live(self, session_id: str) -> None:
+        with self._lock:
+            self._live.pop(session_id, None)
+
+    def _keep_live(self, session_id: str, version: int, interactive_model: InteractiveModel) -> None:
+        with self._lock:
+            self._live[session_id] = (version, interactive_model)
+            self._live.move_to_end(session_id)
+            while len(self._live) > self.max_live_sessions:
+                evicted, _ = self._live.popitem(last=False)
+                lock = self._locks.get(evicted)
+                if lock is not None and not lock.locked():
+                    del self._locks[evicted]
+
+    def live_models(self) -> list[InteractiveModel]:
+        """Sessions currently held by this worker"""
+        with self._lock:
+            return [interactive_model for _, interactive_model in self._live.values()]
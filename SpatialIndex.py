@@ -0,0 +1,50 @@
+import numpy as np
+import trimesh
+from scipy.spatial import cKDTree
+
+# part of the cached index's name, bump whenever SpatialIndex's fields change
+SPATIAL_INDEX_VERSION: int = 1
+
+class SpatialIndex:
+    """
+    Nearest vertex / nearest face queries over a static mesh.
+    Faces are found through a KD-tree over their centroids plus the faces
+    around the nearest vertex, then resolved exactly against those candidates.
+    """
+
+    # faces tested exactly per query
+    candidate_count = 16
+
+    def __init__(self, mesh_data: trimesh.Trimesh):
+        self.__vertices = np.asarray(mesh_data.vertices, dtype=np.float64)
+        self.__triangles = np.asarray(mesh_data.triangles, dtype=np.float64)
+        self.__vertex_faces = np.asarray(mesh_data.vertex_faces)
+
+        self.vertex_tree = cKDTree(self.__vertices)
+        self.face_tree = cKDTree(self.__triangles.mean(axis=1))
+
+    def nearest_vertex(self, x: float, y: float, z: float) -> tuple[int, float]:
+        """Index of and distance to the closest vertex"""
+        distance, idx = self.vertex_tree.query((x, y, z))
+        return int(idx), float(distance)
+
+    def nearest_face(self, x: float, y: float, z: float) -> tuple[int, tuple[float, float, float]]:
+        """Closest face and the closest point on it"""
+        point = np.array([x, y, z], dtype=np.float64)
+
+        k = min(self.candidate_count, len(self.__triangles))
+        _, by_centroid = self.face_tree.query(point, k=k)
+        vertex, _ = self.nearest_vertex(x, y, z)
+        around_vertex = self.__vertex_faces[vertex]
+
+        candidates = np.union1d(np.atleast_1d(by_centroid), around_vertex[around_vertex >= 0])
+        closest = trimesh.triangles.closest_point(
+            self.__triangles[candidates],
+            np.tile(point, (len(candidates), 1))
+        )
+        best = int(np.argmin(((closest - point) ** 2).sum(axis=1)))
+        return int(candidates[best]), tuple(float(c) for c in closest[best])
+
+    def query_radius(self, x: float, y: float, z: float, radius: float) -> list[int]:
+        """All vertices within `radius`"""
+        return self.vertex_tree.query_ball_point((x, y, z), radius)
@@ -0,0 +1,86 @@
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+# how often buffered manifest writes are committed
+COMMIT_EVERY: int = 500
+
+
+@dataclass
+class ManifestEntry:
+    fig_num: str
+    img_url: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
+    status: str = 'pending'  # pending | ok | failed
+
+
+class SyncManifest:
+    """
+    What we last fetched for every figure, so catalog syncs only touch new or changed ones.
+    Also remembers validators for the catalog archive itself.
+    """
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._pending_writes = 0
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS figs ('
+                'fig_num TEXT PRIMARY KEY, img_url TEXT, etag TEXT, last_modified TEXT, '
+                'content_hash TEXT, status TEXT, updated_at REAL)'
+            )
+            self._conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            self._conn.commit()
+
+    def get(self, fig_num: str) -> Optional[ManifestEntry]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT fig_num, img_url, etag, last_modified, content_hash, status FROM figs WHERE fig_num = ?',
+                (fig_num,)
+            ).fetchone()
+        return ManifestEntry(*row) if row else None
+
+    def put(self, entry: ManifestEntry) -> None:
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO figs VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (entry.fig_num, entry.img_url, entry.etag, entry.last_modified,
+                 entry.content_hash, entry.status, time.time())
+            )
+            self._pending_writes += 1
+            if self._pending_writes >= COMMIT_EVERY:
+                self._conn.commit()
+                self._pending_writes = 0
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: Optional[str]) -> None:
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (key, value))
+
+    @staticmethod
+    def conditional_headers(etag: Optional[str], last_modified: Optional[str]) -> dict:
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def commit(self) -> None:
+        with self._lock:
+            self._conn.commit()
+            self._pending_writes = 0
+
+    def close(self) -> None:
+        self.commit()
+        self._conn.close()
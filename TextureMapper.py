@@ -1,74 +1,171 @@
 from Model import Model
-        
-from PIL import Image 
+from MeshCache import MeshCache
+from BakeCache import BakeCache
+
+from PIL import Image
 import numpy as np
-import plotly.graph_objects as go
+from enum import Enum
+from typing import Optional
+
+class Projection(Enum):
+    PLANAR = 'planar'
+    CYLINDRICAL = 'cylindrical'
+    SPHERICAL = 'spherical'
+    BOX = 'box'  # triplanar, blended by the vertex normals
+
+# the lego man is Y-up, so planar looks down Z and wraps go around Y
+UP_AXIS: int = 1
+VIEW_AXIS: int = 2
+
+# how sharply the box projection favours the dominant face
+BOX_BLEND_SHARPNESS: float = 4.0
 
 class TextureMapper:
-    def __init__(self, texture_path: str):
-        
-        # load texture 
+    def __init__(self, texture_path: str, projection: Projection = Projection.PLANAR, mode: str = 'vertex'):
+
+        # load texture
+        self.texture_path = texture_path
         try:
-            self.img = Image.open(texture_path)
-            self.img_arr = np.array(self.img)
+            self.img = Image.open(texture_path).convert('RGB')
+            self.img_arr = np.asarray(self.img, dtype=np.float32)
         except Exception as e:
             print(f"Error loading texture: {e}")
-            raise 
+            raise
+
+        if mode not in ('vertex', 'face'):
+            raise ValueError("mode must be 'vertex' or 'face'")
+        self.projection = Projection(projection)
+        self.mode = mode
+
+    @staticmethod
+    def compute_uvs(model: Model, projection: Projection) -> list[tuple[np.ndarray, np.ndarray]]:
+        """
+        Per-vertex (uv, weight) layers for a projection, cached on the model.
+        UVs are in [0, 1] with v pointing up.
+        """
+        cache_key = ('uv', projection)
+        if cache_key in model.uv_cache:
+            return model.uv_cache[cache_key]
 
-    def apply_texture(self, model: Model) -> None:
-        return
-        # TODO explore alternative strategies, this one is ass 
         mesh_data = model.get_mesh_data()
+        vertices = np.asarray(mesh_data.vertices, dtype=np.float64)
+        lo, hi = vertices.min(axis=0), vertices.max(axis=0)
+        extent = np.where(hi - lo > 0, hi - lo, 1.0)
+        unit = (vertices - lo) / extent
+        ones = np.ones(len(vertices))
+
+        side_axis = 3 - UP_AXIS - VIEW_AXIS
+        match projection:
+            case Projection.PLANAR:
+                layers = [(np.stack([unit[:, side_axis], unit[:, UP_AXIS]], axis=1), ones)]
+            case Projection.CYLINDRICAL | Projection.SPHERICAL:
+                centered = vertices - (lo + hi) / 2
+                theta = np.arctan2(centered[:, side_axis], centered[:, VIEW_AXIS])
+                u = theta / (2 * np.pi) + 0.5
+                if projection == Projection.CYLINDRICAL:
+                    v = unit[:, UP_AXIS]
+                else:
+                    r = np.linalg.norm(centered, axis=1)
+                    r[r == 0] = 1.0
+                    v = 1 - np.arccos(np.clip(centered[:, UP_AXIS] / r, -1, 1)) / np.pi
+                layers = [(np.stack([u, v], axis=1), ones)]
+            case Projection.BOX:
+                weights = np.abs(np.asarray(mesh_data.vertex_normals)) ** BOX_BLEND_SHARPNESS
+                weights /= np.maximum(weights.sum(axis=1, keepdims=True), 1e-12)
+                layers = []
+                for axis in range(3):
+                    u_axis, v_axis = [a for a in range(3) if a != axis]
+                    # keep the up axis as v wherever it is in the plane
+                    if u_axis == UP_AXIS:
+                        u_axis, v_axis = v_axis, u_axis
+                    layers.append((np.stack([unit[:, u_axis], unit[:, v_axis]], axis=1), weights[:, axis]))
+            case _:
+                raise NotImplementedError()
+
+        model.uv_cache[cache_key] = layers
+        return layers
+
+    @staticmethod
+    def sample_bilinear(img_arr: np.ndarray, uv: np.ndarray) -> np.ndarray:
+        """Bilinearly sample an (H, W, C) image at (N, 2) uv coordinates in one pass"""
+        h, w = img_arr.shape[:2]
+        x = np.clip(uv[:, 0], 0, 1) * (w - 1)
+        y = (1 - np.clip(uv[:, 1], 0, 1)) * (h - 1)  # image rows grow downwards
+
+        x0 = np.minimum(x.astype(np.int64), max(w - 2, 0))
+        y0 = np.minimum(y.astype(np.int64), max(h - 2, 0))
+        x1 = np.minimum(x0 + 1, w - 1)
+        y1 = np.minimum(y0 + 1, h - 1)
+        fx = (x - x0)[:, None]
+        fy = (y - y0)[:, None]
+
+        top = img_arr[y0, x0] * (1 - fx) + img_arr[y0, x1] * fx
+        bottom = img_arr[y1, x0] * (1 - fx) + img_arr[y1, x1] * fx
+        return top * (1 - fy) + bottom * fy
 
-        # Get model dimensions
-        vertices = mesh_data.vertices
-        x_min, x_max = vertices[:, 0].min(), vertices[:, 0].max()
-        y_min, y_max = vertices[:, 1].min(), vertices[:, 1].max()
+    @staticmethod
+    def model_ratio(model: Model) -> float:
+        """Width over height of the model as the planar projection sees it"""
+        extents = model.get_mesh_data().extents
+        side_axis = 3 - UP_AXIS - VIEW_AXIS
+        return extents[side_axis] / (extents[UP_AXIS] or 1.0)
 
-        # Calculate aspect ratios
-        model_width = x_max - x_min
-        model_height = y_max - y_min
-        model_ratio = model_width / model_height
+    def fit_uv(self, uv: np.ndarray, model_ratio: float) -> np.ndarray:
+        """Center-crop the texture in uv space so planar textures keep their aspect ratio"""
+        if self.projection != Projection.PLANAR:
+            return uv
 
-        # Load and prepare texture
         img_ratio = self.img.width / self.img.height
 
-        # Resize image to match model aspect ratio
-        if not np.isclose(model_ratio, img_ratio, rtol=0.01):
-            new_height = int(self.img.width / model_ratio)
-            self.img = self.img.resize((self.img.width, new_height), Image.LANCZOS)
+        scale = np.array([1.0, 1.0])
+        if img_ratio > model_ratio:
+            scale[0] = model_ratio / img_ratio
+        else:
+            scale[1] = img_ratio / model_ratio
+        return 0.5 + (uv - 0.5) * scale
 
-        img_arr = np.array(self.img)
-        h, w = img_arr.shape[:2]
+    def bake_layers(self, layers: list[tuple[np.ndarray, np.ndarray]], model_ratio: float,
+                    faces: Optional[np.ndarray] = None) -> np.ndarray:
+        """Bake against precomputed uv layers, so workers never need the Model itself"""
+        colors = np.zeros((len(layers[0][0]), 3), dtype=np.float64)
+        for uv, weight in layers:
+            colors += self.sample_bilinear(self.img_arr, self.fit_uv(uv, model_ratio)) * weight[:, None]
+
+        if self.mode == 'face':
+            colors = colors[faces].mean(axis=1)
 
-        # Generate perfect UV coordinates
-        u = (vertices[:, 0] - x_min) / model_width
-        v = (vertices[:, 1] - y_min) / model_height
-
-        # Ensure perfect 1:1 mapping
-        uv_coords = np.stack([u, 1 - v], axis=1)  # Flip V coordinate for image space
-
-        # Convert to texture indices with exact mapping
-        u_indices = np.clip((uv_coords[:, 0] * (w - 1)), 0, w - 1).astype(int)
-        v_indices = np.clip((uv_coords[:, 1] * (h - 1)), 0, h - 1).astype(int)
-
-        # Sample texture
-        colors = img_arr[v_indices, u_indices] / 255.0
-
-        # Create Plotly 3D mesh
-        mesh = go.Mesh3d(
-            x=mesh_data.vertices[:, 0],
-            y=mesh_data.vertices[:, 1],
-            z=mesh_data.vertices[:, 2],
-            i=mesh_data.faces[:, 0],
-            j=mesh_data.faces[:, 1],
-            k=mesh_data.faces[:, 2],
-            opacity=1,
-            vertexcolor=colors,  # or facecolor=face_colors
-            flatshading=True,
-            # Add this for better color display:
-            intensitymode='vertex',  # or 'cell' if using face colors
-            showscale=False
+        return np.clip(np.rint(colors), 0, 255).astype(np.uint8)
+
+    def bake(self, model: Model) -> np.ndarray:
+        """Per-vertex (or per-face) uint8 RGB colors of this texture on the model"""
+        return self.bake_layers(
+            self.compute_uvs(model, self.projection),
+            self.model_ratio(model),
+            model.get_mesh_data().faces
+        )
+
+    def bake_key(self, model: Model) -> str:
+        """Everything the baked colors depend on"""
+        return BakeCache.key(
+            model.key,
+            MeshCache.key(self.texture_path),
+            self.projection.value,
+            self.mode,
+            UP_AXIS, VIEW_AXIS, BOX_BLEND_SHARPNESS
         )
 
-        model.update_figure(mesh)
\ No newline at end of file
+    def apply_texture(self, model: Model, cache: Optional[BakeCache] = None) -> None:
+        colors = None
+        if cache:
+            key = self.bake_key(model)
+            colors = cache.get(key)
+
+        if colors is None:
+            colors = self.bake(model)
+            if cache:
+                cache.put(key, colors)
+
+        if self.mode == 'vertex':
+            model.set_colors(vertex_rgb=colors)
+        else:
+            model.set_colors(face_rgb=colors)
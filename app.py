@@ -1,79 +1,323 @@
-from dash import Dash, dcc, html, Input, Output, State, callback, no_update, callback_context
-from SceneBuilder import SceneBuilder
+import importlib
+import os
+import sys
+import threading
+import time
+import uuid
+from typing import TYPE_CHECKING, Optional
 
-scene_builder = SceneBuilder()
-interactive_model = scene_builder.interactive_model
+import plotly.io as pio
+from flask import Response, g, has_request_context, request
 
+def import_dash_without_jupyter() -> None:
+    """
+    dash imports IPython for its Jupyter mode whenever it is installed, about half of its import time.
+    Outside a notebook IPython is hidden while dash (and only dash and its dependencies) is first
+    imported, so dash falls back to its Jupyter stubs. IPython stays importable afterwards.
+    """
+    if 'dash' in sys.modules or 'IPython' in sys.modules:
+        return
+    sys.modules['IPython'] = None
+    try:
+        importlib.import_module('dash')
+    finally:
+        del sys.modules['IPython']
+
+import_dash_without_jupyter()
+
+from dash import Dash, dcc, html, Input, Output, State, ClientsideFunction, callback, clientside_callback, no_update, callback_context
+from MeshCache import MeshCache
+from FigureCache import FigureCache
+from Metrics import metrics
+
+# plotly, trimesh and the mesh itself load on first use, not at import
+if TYPE_CHECKING:
+    from InteractiveModel import InteractiveModel
+    from SessionStore import SessionManager
+
+# the mesh is loaded once per worker and shared read-only by every session,
+# markers live per session in the session store (see SESSION_STORE)
+# MODEL_PATH can point at a scan, e.g. scans/<id>/mesh.ply from `process_scans.py`
+MODEL_PATH: str = os.environ.get('MODEL_PATH', './assets/lego_man.glb')
+model_key: str = MeshCache.key(MODEL_PATH)
+
+_sessions: Optional['SessionManager'] = None
+_sessions_lock = threading.Lock()
+_initial: Optional[dict] = None
+
+def get_sessions() -> 'SessionManager':
+    """Build the scene and session manager the first time anything needs them"""
+    global _sessions
+    if _sessions is None:
+        with _sessions_lock:
+            if _sessions is None:
+                from SceneBuilder import SceneBuilder
+                from SessionStore import SessionManager, make_session_store
+                scene_builder = SceneBuilder(MODEL_PATH)
+                _sessions = SessionManager(scene_builder.model, make_session_store())
+    return _sessions
+
+def warm_up() -> None:
+    # the first page is served from the figure cache, the scene loads behind it
+    if _sessions is None:
+        threading.Thread(target=get_sessions, daemon=True).start()
+
+def get_initial() -> dict:
+    """First-paint figure plus the layout values that would otherwise need the model classes"""
+    global _initial
+    if _initial is None:
+        cache = FigureCache()
+        initial = cache.get(model_key)
+        if initial is None:
+            from Model import Model
+            from InteractiveModel import InteractiveModel
+
+            # a blank session is the coarsest mesh and no markers
+            interactive_model = InteractiveModel(get_sessions().model)
+            interactive_model.set_lod(Model.COARSE_LOD)
+            meta = {
+                'lod_levels': list(Model.LOD_LEVELS),
+                'full_lod': Model.FULL_LOD,
+                'coarse_lod': Model.COARSE_LOD,
+                'marker_style': {
+                    'points_trace_index': InteractiveModel.points_trace_index,
+                    'color': InteractiveModel.default_point_color,
+                    'size': InteractiveModel.default_point_size,
+                    'highlighted_color': InteractiveModel.default_highlighted_point_color,
+                    'highlighted_size': InteractiveModel.default_highlighted_point_size
+                }
+            }
+            cache.put(model_key, pio.to_json(interactive_model.get_client_figure()), meta)
+            initial = cache.get(model_key)
+        _initial = initial
+    return _initial
+
+# preview mode lives in the browser, see assets/preview.js
 in_preview_mode: bool = False
 preview_mode_text = lambda in_preview_mode: 'Preview Mode: On' if in_preview_mode else 'Preview Mode: Off'
 
-app = Dash(__name__)
+# dash serializes every response through plotly.io, orjson is several times faster than json
+pio.json.config.default_engine = 'orjson'
+
+# responses are gzip/brotli compressed when the browser accepts it (flask-compress)
+app = Dash(__name__, compress=True)
+
+# hot path timing, payload sizes and session gauges on /metrics (see METRICS)
+if metrics.enabled:
+    # scraping never forces the scene to load
+    live_models = lambda: _sessions.live_models() if _sessions else []
+    metrics.gauge('active_sessions', 'Sessions held live by this worker', lambda: len(live_models()))
+    metrics.gauge('live_markers', 'Markers across live sessions', lambda: sum(len(m.store) for m in live_models()))
+
+    @app.server.before_request
+    def start_request_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.server.after_request
+    def record_response(response):
+        # the branch is set by the callback, anything else served is not a dash update
+        branch = g.get('metrics_branch')
+        if branch and request.path.endswith('/_dash-update-component'):
+            metrics.observe('request_seconds', time.perf_counter() - g.metrics_start, branch=branch)
+            metrics.observe('response_bytes', response.calculate_content_length() or 0, branch=branch)
+        return response
+
+    @app.server.route('/metrics')
+    def serve_metrics():
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def set_branch(branch: str, interactive_model: 'InteractiveModel') -> None:
+    if metrics.enabled:
+        g.metrics_branch = branch
+        metrics.observe('session_markers', len(interactive_model.store), branch=branch)
 
-app.layout = html.Div([
+# what dash validates the layout function against at import, without loading the figure or scene
+SKELETON_INITIAL: dict = {
+    'meta': {'lod_levels': [], 'full_lod': None, 'coarse_lod': None, 'marker_style': {}},
+    'figure': {}
+}
 
-    html.H1("3D Lego Model Viewer - Interactive"),
+def serve_layout():
+    # dash calls this once outside a request to validate it, that must not build the scene
+    if not has_request_context():
+        return make_layout('', SKELETON_INITIAL)
 
-    html.H3(preview_mode_text(in_preview_mode), id='preview-mode-text'),
+    # every page load is a new session, first painted with the coarsest mesh
+    # the session itself is only created by its first callback
+    initial = get_initial()
+    warm_up()
+    return make_layout(str(uuid.uuid4()), initial)
 
-    html.Button('Toggle Preview Mode', id='preview-toggle'),
+def make_layout(session_id: str, initial: dict):
+    meta = initial['meta']
+    return html.Div([
 
-    dcc.Graph(
-        id='3d-model-viewer',
-        figure=interactive_model.figure,
-        style={'height': '80vh'}
-    ),
+        html.H1("3D Lego Model Viewer - Interactive"),
 
-    html.Div([
-        html.P("Click on the model to place a marker and see coordinates."),
-        html.Div(id='click-data'),
-        html.Button('Clear Markers', id='clear-button', n_clicks=0)
-    ], style={'margin-top': '20px'})
+        html.H3(preview_mode_text(in_preview_mode), id='preview-mode-text'),
 
-])
+        html.Button('Toggle Preview Mode', id='preview-toggle'),
+
+        dcc.Store(id='session-id', data=session_id),
+        dcc.Store(id='preview-mode', data=in_preview_mode),
+        dcc.Store(id='marker-style', data=meta['marker_style']),
+        dcc.Store(id='marker-click'),
+        dcc.Store(id='preview-selection'),
+        dcc.Store(id='preview-selection-ack'),
+
+        dcc.RadioItems(
+            id='lod-select',
+            options=[{'label': f'{lod:.0%} faces', 'value': lod} for lod in meta['lod_levels']],
+            value=meta['coarse_lod'],
+            inline=True
+        ),
+
+        dcc.Interval(id='lod-loader', interval=1, max_intervals=1),
+
+        dcc.Graph(
+            id='3d-model-viewer',
+            figure=initial['figure'],
+            style={'height': '80vh'}
+        ),
+
+        html.Div([
+            html.P("Click on the model to place a marker and see coordinates."),
+            html.Div(id='click-data'),
+            html.Button('Clear Markers', id='clear-button', n_clicks=0)
+        ], style={'margin-top': '20px'})
+
+    ])
+
+app.layout = serve_layout
+
+# toggling and highlighting in preview mode never wait on the server
+clientside_callback(
+    ClientsideFunction(namespace='preview', function_name='toggle'),
+    Output('preview-mode', 'data'),
+    Output('preview-mode-text', 'children'),
+    Input('preview-toggle', 'n_clicks'),
+    State('preview-mode', 'data'),
+    prevent_initial_call=True
+)
+
+clientside_callback(
+    ClientsideFunction(namespace='preview', function_name='route_click'),
+    Output('marker-click', 'data'),
+    Output('preview-selection', 'data'),
+    Output('click-data', 'children', allow_duplicate=True),
+    Output('3d-model-viewer', 'figure', allow_duplicate=True),
+    Input('3d-model-viewer', 'clickData'),
+    State('preview-mode', 'data'),
+    State('marker-style', 'data'),
+    State('3d-model-viewer', 'figure'),
+    prevent_initial_call=True
+)
 
 @callback(
     Output('3d-model-viewer', 'figure'),
     Output('click-data', 'children'),
-    Output('preview-mode-text', 'children'),
-    Input('3d-model-viewer', 'clickData'),
+    Input('marker-click', 'data'),
     Input('clear-button', 'n_clicks'),
-    Input('preview-toggle', 'n_clicks'),
     State('3d-model-viewer', 'relayoutData'),  # Add this to get current camera state
+    State('session-id', 'data'),
     prevent_initial_call=True
 )
-def handle_click(clickData, clear_clicks, preview_clicks, relayout_data):
-    global in_preview_mode
+def handle_click(clickData, clear_clicks, relayout_data, session_id):
+    branch = 'clear' if callback_context.triggered_id == 'clear-button' else 'click'
+    if branch == 'click' and not clickData:
+        return no_update, ""
 
-    ctx = callback_context
-    triggered_id = ctx.triggered[0]['prop_id'].split('.')[0]
-    
     # Get current camera state if available
     camera_state = None
     if relayout_data and 'scene.camera' in relayout_data:
         camera_state = relayout_data['scene.camera']
-        
-    if triggered_id == 'clear-button':
-        interactive_model.clear_points()
-        figure = interactive_model.get_figure_with_camera(camera_state)
-        return figure, 'Markers cleared', preview_mode_text(in_preview_mode)
-    
-    if triggered_id == 'preview-toggle':
-        in_preview_mode = not in_preview_mode
-        return no_update, no_update, preview_mode_text(in_preview_mode)
-
-    if clickData:
-        point = clickData['points'][0]
-        x, y, z = round(point['x'], 6), round(point['y'], 6), round(point['z'], 6)
-
-        if not in_preview_mode:
-            interactive_model.add_point(x, y, z)
-        else: # in preview mode 
-            interactive_model.interact_with_point(x, y, z)
-    
-        figure = interactive_model.get_figure_with_camera(camera_state)
-        return figure, f"Clicked at: X={x:.2f}, Y={y:.2f}, Z={z:.2f}", preview_mode_text(in_preview_mode)
-    
-    return no_update, "", no_update
+
+    # the store is written by `change`, the patch is built after, outside of it
+    if branch == 'clear':
+        def change(interactive_model: 'InteractiveModel'):
+            with metrics.time('interactive_model_seconds', op='clear_points'):
+                interactive_model.clear_points()
+
+        def respond(interactive_model: 'InteractiveModel', _):
+            set_branch(branch, interactive_model)
+            return interactive_model.get_points_patch(cleared=True, camera_state=camera_state), 'Markers cleared'
+    else:
+        def change(interactive_model: 'InteractiveModel'):
+            point = clickData['points'][0]
+            x, y, z = point['x'], point['y'], point['z']
+
+            # clicks on any LOD snap to the closest face of the full resolution mesh
+            face_id = -1
+            if point.get('curveNumber') == 0:
+                with metrics.time('interactive_model_seconds', op='snap'):
+                    (x, y, z), face_id = interactive_model.get_lego_model().snap(x, y, z)
+            x, y, z = round(x, 6), round(y, 6), round(z, 6)
+
+            with metrics.time('interactive_model_seconds', op='add_point'):
+                row = interactive_model.add_point(x, y, z, face_id)
+            return row, (x, y, z)
+
+        def respond(interactive_model: 'InteractiveModel', added):
+            set_branch(branch, interactive_model)
+            row, (x, y, z) = added
+
+            # only send the new marker row, the mesh stays in the browser
+            # the highlight is left alone, preview mode patches it into the same figure client side
+            appended = [row] if row is not None else []
+            figure = interactive_model.get_points_patch(appended=appended, camera_state=camera_state)
+            return figure, f"Clicked at: X={x:.2f}, Y={y:.2f}, Z={z:.2f}"
+
+    with metrics.time('callback_seconds', branch=branch):
+        return get_sessions().update(session_id, change, respond)
+
+@callback(
+    Output('preview-selection-ack', 'data'),
+    Input('preview-selection', 'data'),
+    State('session-id', 'data'),
+    prevent_initial_call=True
+)
+def sync_preview_selection(selection, session_id):
+    # the browser already shows the highlight, just keep the server copy in step
+    if selection:
+        def change(interactive_model: 'InteractiveModel'):
+            with metrics.time('interactive_model_seconds', op='interact_with_point'):
+                interactive_model.interact_with_point(selection['x'], selection['y'], selection['z'])
+
+        with metrics.time('callback_seconds', branch='preview'):
+            get_sessions().update(session_id, change, lambda interactive_model, _: set_branch('preview', interactive_model))
+    return selection
+
+@callback(
+    Output('lod-select', 'value'),
+    Input('lod-loader', 'n_intervals'),
+    prevent_initial_call=True
+)
+def load_full_lod(n_intervals):
+    return get_initial()['meta']['full_lod']
+
+@callback(
+    Output('3d-model-viewer', 'figure', allow_duplicate=True),
+    Input('lod-select', 'value'),
+    State('3d-model-viewer', 'relayoutData'),
+    State('session-id', 'data'),
+    prevent_initial_call=True
+)
+def select_lod(lod, relayout_data, session_id):
+    camera_state = None
+    if relayout_data and 'scene.camera' in relayout_data:
+        camera_state = relayout_data['scene.camera']
+
+    def change(interactive_model: 'InteractiveModel'):
+        with metrics.time('interactive_model_seconds', op='set_lod'):
+            interactive_model.set_lod(lod)
+
+    def respond(interactive_model: 'InteractiveModel', _):
+        set_branch('lod', interactive_model)
+        return interactive_model.get_client_figure(camera_state)
+
+    # the full figure is built after the write, never while holding the store
+    with metrics.time('callback_seconds', branch='lod'):
+        return get_sessions().update(session_id, change, respond)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8050)
\ No newline at end of file
@@ -0,0 +1,49 @@
+// Preview mode runs in the browser, the server only hears about the selection afterwards
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    preview: {
+        toggle: function (n_clicks, in_preview_mode) {
+            const on = !in_preview_mode;
+            return [on, on ? 'Preview Mode: On' : 'Preview Mode: Off'];
+        },
+
+        route_click: function (clickData, in_preview_mode, style, figure) {
+            const no_update = window.dash_clientside.no_update;
+            if (!clickData) {
+                return [no_update, no_update, no_update, no_update];
+            }
+
+            // placing markers still goes through the server
+            if (!in_preview_mode) {
+                return [clickData, no_update, no_update, no_update];
+            }
+
+            // only clicks on an existing marker can highlight it
+            const point = clickData.points[0];
+            if (point.curveNumber !== style.points_trace_index) {
+                return [no_update, no_update, no_update, no_update];
+            }
+
+            // the highlight is patched into the figure prop itself, the server patches that same
+            // figure, so a restyle of the plot alone would be undone or doubled by the next one
+            const trace = figure.data[style.points_trace_index];
+            const idx = point.pointNumber;
+            const colors = Array.from(trace.x, () => style.color);
+            const sizes = Array.from(trace.x, () => style.size);
+            colors[idx] = style.highlighted_color;
+            sizes[idx] = style.highlighted_size;
+            const marker = ['data', style.points_trace_index, 'marker'];
+            const patch = new window.dash_clientside.Patch()
+                .assign([...marker, 'color'], colors)
+                .assign([...marker, 'size'], sizes)
+                .build();
+
+            const x = trace.x[idx], y = trace.y[idx], z = trace.z[idx];
+            return [
+                no_update,
+                {x: x, y: y, z: z},
+                `Clicked at: X=${x.toFixed(2)}, Y=${y.toFixed(2)}, Z=${z.toFixed(2)}`,
+                patch
+            ];
+        }
+    }
+});
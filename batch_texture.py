@@ -0,0 +1,152 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from tqdm import tqdm
+
+from BakeCache import BakeCache
+from MeshCache import MeshCache
+from Model import Model
+from TextureMapper import BOX_BLEND_SHARPNESS, UP_AXIS, VIEW_AXIS, Projection, TextureMapper
+
+PREFIX: str = ">>"
+logging.basicConfig(format=f'{PREFIX} %(message)s', level=logging.INFO)
+log = logging.getLogger(__name__)
+
+MINIFIG_DATA_PATH: str = "../minifigs"
+OUTPUT_PATH: str = "../minifig_bakes"
+
+# set once per worker by `_init_worker`, so no task ever pickles the mesh
+_worker: dict = {}
+
+
+def find_textures(source: str) -> list[tuple[str, str]]:
+    """(fig_num, texture path) pairs from a directory of `{fig_num}.jpg` or a `fig_num,path` csv"""
+    if os.path.isdir(source):
+        return sorted(
+            (Path(name).stem, os.path.join(source, name))
+            for name in os.listdir(source)
+            if name.lower().endswith(('.jpg', '.jpeg', '.png', '.webp'))
+        )
+
+    with open(source, newline='') as f:
+        return [(row['fig_num'], row['path']) for row in csv.DictReader(f)]
+
+
+def uv_entry_name(projection: Projection) -> str:
+    # the uvs depend on the projection settings too, same as `TextureMapper.bake_key`
+    settings = BakeCache.key(UP_AXIS, VIEW_AXIS, BOX_BLEND_SHARPNESS)[:16]
+    return f'uv_{projection.value}_{settings}'
+
+
+def share_uvs(model: Model, projection: Projection, cache: MeshCache) -> None:
+    """Write the model's uv layers next to the cached mesh for workers to memory-map"""
+    if cache.get_arrays(model.key, uv_entry_name(projection)) is not None:
+        return
+
+    arrays = {}
+    for i, (uv, weight) in enumerate(TextureMapper.compute_uvs(model, projection)):
+        arrays[f'uv{i}'] = uv
+        arrays[f'weight{i}'] = weight
+    cache.put_arrays(model.key, uv_entry_name(projection), arrays)
+
+
+def _init_worker(model_key: str, projection: Projection, mode: str, model_ratio: float, out_path: str) -> None:
+    cache = MeshCache()
+    uvs = cache.get_arrays(model_key, uv_entry_name(projection))
+    n_layers = len(uvs) // 2
+
+    _worker['layers'] = [(uvs[f'uv{i}'], uvs[f'weight{i}']) for i in range(n_layers)]
+    _worker['faces'] = cache.get_arrays(model_key, 'mesh')['faces']
+    _worker['projection'] = projection
+    _worker['mode'] = mode
+    _worker['model_ratio'] = model_ratio
+    _worker['out'] = np.load(out_path, mmap_mode='r+')
+
+
+def _bake_one(row: int, texture_path: str) -> tuple[int, Optional[str]]:
+    try:
+        mapper = TextureMapper(texture_path, _worker['projection'], _worker['mode'])
+        _worker['out'][row] = mapper.bake_layers(_worker['layers'], _worker['model_ratio'], _worker['faces'])
+        return row, None
+    except Exception as e:
+        return row, str(e)
+
+
+def bake_all(
+    model_path: str,
+    textures: list[tuple[str, str]],
+    out_path: str = OUTPUT_PATH,
+    projection: Projection = Projection.PLANAR,
+    mode: str = 'vertex',
+    max_workers: Optional[int] = None
+) -> dict:
+    """
+    Bake every texture onto one model into `{out_path}.npy`, a (textures, colors, 3) uint8
+    array, with `{out_path}.json` mapping rows back to fig_nums.
+    """
+    cache = MeshCache()
+    model = Model(model_path)
+    share_uvs(model, projection, cache)
+
+    mesh_data = model.get_mesh_data()
+    n_colors = len(mesh_data.vertices) if mode == 'vertex' else len(mesh_data.faces)
+    array_path = f'{out_path}.npy'
+    os.makedirs(os.path.dirname(os.path.abspath(array_path)), exist_ok=True)
+    np.lib.format.open_memmap(array_path, mode='w+', dtype=np.uint8, shape=(len(textures), n_colors, 3)).flush()
+
+    failed: dict[str, str] = {}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_init_worker,
+        initargs=(model.key, projection, mode, TextureMapper.model_ratio(model), array_path)
+    ) as executor:
+        futures = [executor.submit(_bake_one, row, path) for row, (_, path) in enumerate(textures)]
+        with tqdm(total=len(futures), unit='tex') as pbar:
+            for future in as_completed(futures):
+                row, error = future.result()
+                if error:
+                    failed[textures[row][0]] = error
+                pbar.update(1)
+    elapsed = time.perf_counter() - start
+
+    index = {
+        'model_key': model.key,
+        'projection': projection.value,
+        'mode': mode,
+        'fig_nums': [fig_num for fig_num, _ in textures],
+        'failed': failed
+    }
+    with open(f'{out_path}.json', 'w') as f:
+        json.dump(index, f)
+
+    log.info(f'Baked {len(textures) - len(failed)}/{len(textures)} textures in {elapsed:.1f}s '
+             f'({len(textures) / max(elapsed, 1e-9):.1f} tex/s)')
+    return index
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Bake a texture library onto one model')
+    parser.add_argument('--model', default='./assets/lego_man.glb')
+    parser.add_argument('--textures', default=MINIFIG_DATA_PATH, help='directory of {fig_num}.jpg or fig_num,path csv')
+    parser.add_argument('--out', default=OUTPUT_PATH)
+    parser.add_argument('--projection', default=Projection.PLANAR.value, choices=[p.value for p in Projection])
+    parser.add_argument('--mode', default='vertex', choices=['vertex', 'face'])
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    textures = find_textures(args.textures)
+    log.info(f'Baking {len(textures)} textures onto `{args.model}`...')
+    bake_all(args.model, textures, args.out, Projection(args.projection), args.mode, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,385 @@
+import argparse
+import gzip
+import importlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from io import BytesIO
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+import numpy as np
+from PIL import Image
+
+# Hot path benchmarks over synthetic meshes and images.
+# Results are written as json and compared against a stored baseline,
+# any benchmark slower than the baseline by more than the threshold fails the run.
+# Heavy imports happen inside each benchmark so one missing dependency only skips its own benchmarks.
+
+RESULTS_PATH: str = "benchmark_results.json"
+BASELINE_PATH: str = "benchmark_baseline.json"
+REGRESSION_THRESHOLD: float = 0.20
+
+REPEAT: int = 5
+MARKER_COUNTS: tuple[int, ...] = (10, 100, 1_000, 10_000)
+# operations timed per repeat once the markers are in place
+MARKER_OPS: int = 50
+
+
+@dataclass(frozen=True)
+class Tier:
+    mesh_subdivisions: int  # icosphere, 20 * 4^n faces
+    image_size: int
+    image_count: int
+
+
+TIERS: dict[str, Tier] = {
+    'small': Tier(mesh_subdivisions=3, image_size=256, image_count=32),
+    'medium': Tier(mesh_subdivisions=5, image_size=1024, image_count=16),
+    'large': Tier(mesh_subdivisions=7, image_size=3000, image_count=8),
+}
+
+
+def measure(fn: Callable[[], None], repeat: int = REPEAT, number: int = 1,
+            setup: Optional[Callable[[], None]] = None) -> dict:
+    """Seconds per operation, `fn` runs `number` operations per call"""
+    runs = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        runs.append((time.perf_counter() - start) / number)
+    return summarize(runs, number)
+
+
+def summarize(runs: list[float], number: int = 1) -> dict:
+    return {
+        'median_s': statistics.median(runs),
+        'min_s': min(runs),
+        'mean_s': statistics.fmean(runs),
+        'repeat': len(runs),
+        'number': number
+    }
+
+
+def synthetic_mesh(tier: Tier, workdir: Path) -> str:
+    import trimesh
+
+    path = workdir / f"sphere_{tier.mesh_subdivisions}.ply"
+    if not path.exists():
+        mesh = trimesh.creation.icosphere(subdivisions=tier.mesh_subdivisions)
+        # a little noise so decimation and snapping see a realistic surface
+        rng = np.random.default_rng(0)
+        mesh.vertices += rng.normal(scale=1e-3, size=mesh.vertices.shape)
+        mesh.export(path)
+    return str(path)
+
+
+def synthetic_image(size: int, seed: int = 0) -> Image.Image:
+    rng = np.random.default_rng(seed)
+    # smooth gradients plus noise, closer to a photo than pure noise for the jpeg encoder
+    y, x = np.mgrid[0:size, 0:size] / size
+    base = np.stack([x, y, (x + y) / 2], axis=-1) * 255
+    noise = rng.normal(scale=12, size=base.shape)
+    return Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8))
+
+
+def random_markers(model, n: int, seed: int = 0) -> np.ndarray:
+    """Distinct points on the surface, so none of them dedupe into an existing marker"""
+    mesh_data = model.get_mesh_data()
+    rng = np.random.default_rng(seed)
+    triangles = np.asarray(mesh_data.vertices)[np.asarray(mesh_data.faces)[rng.integers(len(mesh_data.faces), size=n)]]
+    weights = rng.dirichlet(np.ones(3), size=n)
+    return np.einsum('nk,nkd->nd', weights, triangles)
+
+
+def marker_state(points: np.ndarray) -> dict:
+    from Model import Model
+    return {
+        'lod': Model.COARSE_LOD,
+        'points': [[float(x), float(y), float(z), -1] for x, y, z in points],
+        'highlighted': None
+    }
+
+
+def bench_model(tier: Tier, workdir: Path) -> Iterator[tuple[str, dict]]:
+    from Model import Model
+
+    path = synthetic_mesh(tier, workdir)
+    yield 'model_load_cold', measure(lambda: Model(path, use_cache=False), repeat=3)
+    Model(path)  # prime the mesh cache
+    yield 'model_load_warm', measure(lambda: Model(path))
+
+
+def bench_markers(tier: Tier, workdir: Path) -> Iterator[tuple[str, dict]]:
+    from Model import Model
+    from InteractiveModel import InteractiveModel
+
+    model = Model(synthetic_mesh(tier, workdir))
+    for n in MARKER_COUNTS:
+        ops = MARKER_OPS
+        points = random_markers(model, n + ops, seed=n)
+        existing, new = points[:n], points[n:]
+        state = marker_state(existing)
+        holder = {}
+
+        def fresh():
+            holder['im'] = InteractiveModel.from_state(model, state)
+
+        def add():
+            im = holder['im']
+            for x, y, z in new:
+                im.add_point(float(x), float(y), float(z))
+
+        def interact():
+            im = holder['im']
+            for x, y, z in existing[:ops]:
+                im.interact_with_point(float(x), float(y), float(z))
+
+        def flush():
+            im = holder['im']
+            for _ in range(ops):
+                with im.updater:
+                    pass
+
+        yield f'add_point@{n}', measure(add, number=ops, setup=fresh)
+        yield f'interact_with_point@{n}', measure(interact, number=min(n, ops), setup=fresh)
+        yield f'updater_flush@{n}', measure(flush, number=ops, setup=fresh)
+
+
+def bench_handle_click(tier: Tier, workdir: Path) -> Iterator[tuple[str, dict]]:
+    # the app builds its scene at import, point it at the synthetic mesh first
+    os.environ['MODEL_PATH'] = synthetic_mesh(tier, workdir)
+    import app as dash_app
+    from InteractiveModel import InteractiveModel
+
+    client = dash_app.app.server.test_client()
+    client.get('/')  # registers the callbacks
+    output = next(
+        key for key, spec in dash_app.app.callback_map.items()
+        if any(i['id'] == 'marker-click' for i in spec['inputs'])
+    )
+    model = dash_app.get_sessions().model
+
+    for n in MARKER_COUNTS:
+        session_id = f'bench-{n}'
+        ops = MARKER_OPS
+        points = random_markers(model, n + ops, seed=n)
+        state = marker_state(points[:n])
+
+        def fresh():
+            # a stored session with n markers, written the way a worker writes its changes
+            store = dash_app.get_sessions().store
+            store.delete(session_id)
+            store.save(session_id, 0, InteractiveModel.from_state(model, state).take_changes())
+
+        def clicks():
+            for x, y, z in points[n:]:
+                response = client.post('/_dash-update-component', json={
+                    'output': output,
+                    'outputs': [
+                        {'id': '3d-model-viewer', 'property': 'figure'},
+                        {'id': 'click-data', 'property': 'children'}
+                    ],
+                    'inputs': [
+                        {'id': 'marker-click', 'property': 'data', 'value': {
+                            'points': [{'x': float(x), 'y': float(y), 'z': float(z), 'curveNumber': 0}]
+                        }},
+                        {'id': 'clear-button', 'property': 'n_clicks', 'value': 0}
+                    ],
+                    'state': [
+                        {'id': '3d-model-viewer', 'property': 'relayoutData', 'value': None},
+                        {'id': 'session-id', 'property': 'data', 'value': session_id}
+                    ],
+                    'changedPropIds': ['marker-click.data']
+                })
+                if response.status_code != 200:
+                    raise RuntimeError(f"handle_click returned {response.status_code}")
+
+        yield f'handle_click@{n}', measure(clicks, number=ops, setup=fresh)
+
+
+def bench_payload(tier: Tier, workdir: Path) -> Iterator[tuple[str, dict]]:
+    # full-figure responses as dash sends them, sizes ride along with the timings
+    os.environ['MODEL_PATH'] = synthetic_mesh(tier, workdir)
+    importlib.import_module('app')  # only for its side effect, the orjson serializer engine
+    from dash._utils import to_json
+    from Model import Model
+    from InteractiveModel import InteractiveModel
+
+    interactive_model = InteractiveModel(Model(synthetic_mesh(tier, workdir)))
+    for lod in Model.LOD_LEVELS:
+        interactive_model.set_lod(lod)
+        payload = to_json(interactive_model.get_client_figure()).encode()
+        result = measure(lambda: to_json(interactive_model.get_client_figure()))
+        result.update(bytes=len(payload), gzip_bytes=len(gzip.compress(payload)))
+        yield f'client_figure_lod_{lod:g}', result
+
+
+def bench_startup(tier: Tier, workdir: Path) -> Iterator[tuple[str, dict]]:
+    # a fresh interpreter per run, the way a new server worker starts,
+    # timed from the first import to the first layout response
+    from FigureCache import FigureCache
+    from MeshCache import MeshCache
+
+    model_path = synthetic_mesh(tier, workdir)
+    env = {**os.environ, 'MODEL_PATH': model_path}
+    script = (
+        "import time; start = time.perf_counter(); import app; "
+        "app.app.server.test_client().get('/_dash-layout'); print(time.perf_counter() - start)"
+    )
+    figure_path = FigureCache().path(MeshCache.key(model_path))
+
+    def first_layout(cold: bool) -> float:
+        if cold and figure_path.exists():
+            os.remove(figure_path)
+        result = subprocess.run(
+            [sys.executable, '-c', script], env=env, cwd=Path(__file__).parent, check=True, capture_output=True, text=True
+        )
+        return float(result.stdout.strip().splitlines()[-1])
+
+    yield 'first_layout_cold', summarize([first_layout(cold=True) for _ in range(3)])
+    yield 'first_layout_warm', summarize([first_layout(cold=False) for _ in range(REPEAT)])
+
+
+def bench_texture(tier: Tier, workdir: Path) -> Iterator[tuple[str, dict]]:
+    from Model import Model
+    from TextureMapper import Projection, TextureMapper
+
+    model = Model(synthetic_mesh(tier, workdir))
+    texture_path = workdir / f"texture_{tier.image_size}.png"
+    synthetic_image(tier.image_size).save(texture_path)
+
+    for projection in (Projection.PLANAR, Projection.BOX):
+        mapper = TextureMapper(str(texture_path), projection)
+        # no bake cache, this times the bake itself (UVs stay cached on the model after the first run)
+        yield f'apply_texture_{projection.value}', measure(lambda: mapper.apply_texture(model, None))
+
+
+def bench_images(tier: Tier, workdir: Path) -> Iterator[tuple[str, dict]]:
+    from ImagePreProcessor import ImagePreprocessor, PROCESSING_PRESET
+
+    contents = []
+    for seed in range(tier.image_count):
+        buffer = BytesIO()
+        synthetic_image(tier.image_size, seed).save(buffer, 'JPEG', quality=90)
+        contents.append(buffer.getvalue())
+
+    out_dir = workdir / 'processed'
+    os.makedirs(out_dir, exist_ok=True)
+    for preset in PROCESSING_PRESET:
+        items = [(content, str(out_dir / f"{i}.jpg")) for i, content in enumerate(contents)]
+        yield f'process_batch_{preset.name.lower()}', measure(
+            lambda: ImagePreprocessor.process_batch(items, preset), number=len(items)
+        )
+
+
+BENCHMARKS: dict[str, Callable[[Tier, Path], Iterator[tuple[str, dict]]]] = {
+    'model': bench_model,
+    'markers': bench_markers,
+    'handle_click': bench_handle_click,
+    'payload': bench_payload,
+    'startup': bench_startup,
+    'texture': bench_texture,
+    'images': bench_images,
+}
+# marker counts are their own tiers, these only run on the first tier selected
+SINGLE_TIER: tuple[str, ...] = ('markers', 'handle_click')
+
+
+def run(tiers: list[str], only: Optional[list[str]] = None) -> dict:
+    results, skipped = {}, {}
+    with tempfile.TemporaryDirectory() as workdir:
+        # synthetic meshes never land in the repo's caches, set before any cache module is imported
+        # and inherited by the startup benchmark's subprocesses
+        os.environ['CACHE_PATH'] = str(Path(workdir) / 'cache')
+        for group, bench in BENCHMARKS.items():
+            if only and group not in only:
+                continue
+            for tier_name in (tiers[:1] if group in SINGLE_TIER else tiers):
+                try:
+                    for name, result in bench(TIERS[tier_name], Path(workdir)):
+                        key = f'{name}[{tier_name}]'
+                        results[key] = result
+                        print(f"{key:<48} {result['median_s'] * 1000:10.3f} ms/op")
+                except ImportError as e:
+                    skipped[group] = str(e)
+                    print(f"Skipping {group}: {e}")
+                    break
+
+    return {
+        'meta': {
+            'timestamp': time.time(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'tiers': tiers
+        },
+        'results': results,
+        'skipped': skipped
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float = REGRESSION_THRESHOLD) -> list[str]:
+    """Names of benchmarks whose median regressed past the threshold"""
+    regressions = []
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        ratio = result['median_s'] / max(base['median_s'], 1e-12)
+        flag = ''
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<48} {base['median_s'] * 1000:10.3f} -> {result['median_s'] * 1000:10.3f} ms/op  x{ratio:.2f}{flag}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the hot paths and compare against a baseline')
+    parser.add_argument('--tiers', default='small,medium', help=f'comma separated, from {",".join(TIERS)}')
+    parser.add_argument('--only', default=None, help=f'comma separated, from {",".join(BENCHMARKS)}')
+    parser.add_argument('--out', default=RESULTS_PATH)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD, help='allowed slowdown, 0.2 = 20%%')
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the new baseline')
+    args = parser.parse_args()
+
+    tiers = args.tiers.split(',')
+    unknown = [t for t in tiers if t not in TIERS]
+    if unknown:
+        parser.error(f"unknown tiers {unknown}")
+
+    current = run(tiers, args.only.split(',') if args.only else None)
+    with open(args.out, 'w') as f:
+        json.dump(current, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(current, f, indent=2)
+        print(f"Saved baseline to `{args.baseline}`")
+        return
+
+    if not os.path.exists(args.baseline):
+        # nothing was compared, that must not look like a pass
+        print(f"ERROR: no baseline at `{args.baseline}`, nothing was checked for regressions")
+        print("Run with --save-baseline to create one")
+        exit(2)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(current, baseline, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}")
+        exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,18 @@
-import pandas as pd 
 import requests
 import os
+import csv
+import json
 from zipfile import ZipFile
 from io import BytesIO
 import logging
 from logging import info as print # LMAO 
 import logging
-from PIL import Image 
-import numpy as np
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterator
 from tqdm import tqdm 
 
-from ImagePreProcessor import ImagePreprocessor
+from Downloader import Downloader, DownloadError
+from IngestPipeline import IngestPipeline
+from SyncManifest import SyncManifest, ManifestEntry
 PREFIX: str = ">>"
 # setup prefix >> for pretty STDOUT (i overode print) (its my project)
 logging.basicConfig(format=f'{PREFIX} %(message)s', level=logging.INFO)
@@ -20,74 +21,133 @@ logging.basicConfig(format=f'{PREFIX} %(message)s', level=logging.INFO)
 URL: str = "https://cdn.rebrickable.com/media/downloads/minifigs.csv.zip?1765350724.8110726"
 CSV_PATH: str = "../minifigs.csv"
 MINIFIG_DATA_PATH: str = "../minifigs"
+FAILURE_REPORT_PATH: str = "../minifigs_failed.json"
+MANIFEST_PATH: str = "../minifigs_manifest.db"
 
-# an optimization to consider
-# what if we already have some figures downloaded? 
-# we shouldnt redownload it that's a waste of time 
-downloaded: set[str] = set() 
+# downloading is I/O bound, so this is not tied to the cpu count
+MAX_CONCURRENCY: int = int(os.environ.get('MINIFIG_CONCURRENCY', 32))
+MAX_RETRIES: int = 4
+TIMEOUT: tuple[float, float] = (5.0, 30.0)  # (connect, read) seconds
+# decoding and resizing is CPU bound, one process per core
+PROCESS_WORKERS: int = os.cpu_count() or 4
+
+# also send conditional requests for figures we already have, to catch
+# images that changed behind an unchanged url (costs one request per figure)
+REVALIDATE: bool = os.environ.get('MINIFIG_REVALIDATE') == '1'
+
+manifest: SyncManifest = None
 
 def main() -> None:
-    # look for minifigs.csv in current directory 
-    # if we havent found one, unzip it from online
-    if not os.path.exists(CSV_PATH):
-        print(f"Could not find `{CSV_PATH}`. Installing from online...")
-        response: requests.Response = requests.get(URL)
+    global manifest
+    os.makedirs(MINIFIG_DATA_PATH, exist_ok=True)
+    manifest = SyncManifest(MANIFEST_PATH)
 
-        if response.status_code != 200:
-            print(f'>> Could not install from online: {response}')
-            exit()
-        
-        with ZipFile(BytesIO(response.content)) as zip_file:
-            zip_file.extractall()  # Extracts to the current directory
-            print("Files extracted successfully")
+    # refresh minifigs.csv only when rebrickable has a newer archive
+    sync_catalog(manifest)
 
     # maybe we didnt successfully unzip?
     if not os.path.exists(CSV_PATH):
         print(f"Something went wrong when getting {CSV_PATH}")
         exit()
     else:
-        print(f"Downloading imgs to `{MINIFIG_DATA_PATH}`...")
+        print(f"Syncing imgs to `{MINIFIG_DATA_PATH}`...")
 
-    # download images into our directory 
-    os.makedirs(MINIFIG_DATA_PATH, exist_ok=True)
+    # jobs are planned while the catalog streams past, never held all at once
+    planned = 0
+    def counted_jobs() -> Iterator[tuple[str, str, dict]]:
+        nonlocal planned
+        for job in plan_jobs(manifest):
+            planned += 1
+            yield job
 
-    global downloaded
-    downloaded = set(os.listdir(MINIFIG_DATA_PATH))
-
-    data: np.ndarray = pd.read_csv(
-        CSV_PATH,
-        usecols = [
-            'fig_num',
-            'img_url'
-        ]
-    ).to_numpy()
-
-    with tqdm(total=len(data)) as pbar:
-        with ThreadPoolExecutor(max_workers=os.cpu_count() or 4) as executor:
-            futures = executor.map(lambda d: download(*d), data)
-            [pbar.update(1) for _ in futures]
+    # threads fetch, processes decode/resize/encode, see IngestPipeline
+    downloader = Downloader(concurrency=MAX_CONCURRENCY, timeout=TIMEOUT, max_retries=MAX_RETRIES)
+    pipeline = IngestPipeline(downloader, process_workers=PROCESS_WORKERS)
+    with tqdm(unit='fig') as pbar:
+        failures = pipeline.run(counted_jobs(), image_path, save, on_fetched=lambda: pbar.update(1))
+    downloader.close()
+
+    # failures carry the catalog url they were planned with
+    for fig_id, failure in failures.items():
+        manifest.put(ManifestEntry(fig_id, failure['url'], status='failed'))
+    manifest.close()
     
     # cleanup 
     # os.removedirs(CSV_PATH)
-    
-    print('Finished!')
 
-def download(fig_id: str, url: str) -> None:
-    global downloaded 
+    with open(FAILURE_REPORT_PATH, 'w') as f:
+        json.dump(failures, f, indent=2)
+    for stage in pipeline.stats():
+        print(stage)
+    print(f'Finished! {planned - len(failures)}/{planned} new or changed figures synced, failures in `{FAILURE_REPORT_PATH}`')
+
+def sync_catalog(manifest: SyncManifest) -> None:
+    headers = {}
+    if os.path.exists(CSV_PATH):
+        headers = manifest.conditional_headers(
+            manifest.get_meta('catalog_etag'),
+            manifest.get_meta('catalog_last_modified')
+        )
 
-    if f'{fig_id}.jpg' in downloaded:
-        return # no need to download it again 
-    
-    response: requests.Response = requests.get(url,stream=True) 
-    if response.status_code != 200:
-        return # silent skip if we hit something like 404 not found 
-    
     try:
-        img = Image.open(BytesIO(response.content))
-        img = ImagePreprocessor.format(img)
-        ImagePreprocessor.save_to(img, f'{MINIFIG_DATA_PATH}/{fig_id}.jpg')
-    except OSError:
-        return # OSError: cannot write mode RGBA as JPEG
+        response = Downloader(concurrency=1, timeout=TIMEOUT, max_retries=MAX_RETRIES).fetch(URL, headers)
+    except DownloadError as e:
+        if os.path.exists(CSV_PATH):
+            print(f'Could not refresh the catalog ({e}), using the one we have')
+            return
+        print(f'>> Could not install from online: {e}')
+        exit()
+
+    if response.status_code == 304:
+        print(f"`{CSV_PATH}` is up to date")
+        return
+
+    print(f"Installing `{CSV_PATH}` from online...")
+    with ZipFile(BytesIO(response.content)) as zip_file:
+        zip_file.extractall(os.path.dirname(CSV_PATH) or '.')
+        print("Files extracted successfully")
+
+    manifest.set_meta('catalog_etag', response.headers.get('ETag'))
+    manifest.set_meta('catalog_last_modified', response.headers.get('Last-Modified'))
+    manifest.commit()
+
+def read_catalog() -> Iterator[tuple[str, str]]:
+    # stream rows, the catalog never needs to be in memory at once
+    with open(CSV_PATH, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            if row.get('img_url'):
+                yield row['fig_num'], row['img_url']
+
+def plan_jobs(manifest: SyncManifest) -> Iterator[tuple[str, str, dict]]:
+    """(fig_id, url, headers) for every figure that is new, changed, failed or missing on disk"""
+    for fig_id, url in read_catalog():
+        entry = manifest.get(fig_id)
+        on_disk = os.path.exists(f'{MINIFIG_DATA_PATH}/{fig_id}.jpg')
+
+        # images from before the manifest existed are adopted as they are
+        if entry is None and on_disk:
+            manifest.put(ManifestEntry(fig_id, url, status='ok'))
+            continue
+
+        if entry is None or entry.img_url != url or entry.status != 'ok' or not on_disk:
+            yield fig_id, url, {}
+        elif REVALIDATE:
+            yield fig_id, url, manifest.conditional_headers(entry.etag, entry.last_modified)
+
+def image_path(fig_id: str) -> str:
+    return f'{MINIFIG_DATA_PATH}/{fig_id}.jpg'
+
+def save(fig_id: str, url: str, response: requests.Response, content_hash: str) -> None:
+    # the image is on disk by now, just remember what we fetched
+    # `url` is the catalog's, the response may have been redirected elsewhere
+    manifest.put(ManifestEntry(
+        fig_num=fig_id,
+        img_url=url,
+        etag=response.headers.get('ETag'),
+        last_modified=response.headers.get('Last-Modified'),
+        content_hash=content_hash,
+        status='ok'
+    ))
             
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,27 @@
+import sys
+import time
+
+from MinifigDataset import MinifigDataset
+from MinifigSearch import MinifigSearch
+
+TOP_K: int = 5
+
+def main() -> None:
+    if len(sys.argv) < 2:
+        print("usage: python identify_minifig.py <image> [<image> ...]")
+        exit(1)
+
+    search = MinifigSearch(MinifigDataset())
+
+    start = time.perf_counter()
+    results = search.query(sys.argv[1:], k=TOP_K)
+    elapsed = time.perf_counter() - start
+
+    for path, matches in zip(sys.argv[1:], results):
+        print(f"{path}:")
+        for fig_num, score in matches:
+            print(f"  {fig_num}  {score:.3f}")
+    print(f"{len(results)} queries against {len(search.fig_nums)} figures in {elapsed * 1000:.1f}ms")
+
+if __name__ == '__main__':
+    main()
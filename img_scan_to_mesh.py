@@ -8,16 +8,20 @@ import time
 from datetime import datetime
 from PIL import Image
 import subprocess
+import threading
+import queue
+from dataclasses import dataclass, field
 from pathlib import Path
 from itertools import count
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
-from ImagePreProcessor import ImagePreprocessor
+from ImagePreProcessor import ImagePreprocessor, PROCESSING_PRESET
+from ColmapPipeline import ColmapPipeline
+from ScanQueue import ScanQueue, WORKSPACE, IMG_DIR_NAME
 
 load_dotenv()
 
-# file structure styled db?
-WORKSPACE: Path = Path(__file__).parent / "scans"
-
 IP_REGEX: str = (
     r"^(?:25[0-5]|2[0-4][0-9]|?[0-9][0-9]?)\\."
       r"(?:25[0-5]|2[0-4][0-9]|?[0-9][0-9]?)\\."
@@ -27,6 +31,20 @@ IP_REGEX: str = (
 
 MAX_COLLECTION: int = 200
 
+# captures stay full size for COLMAP, the preset only picks the jpeg quality
+CAPTURE_PRESET: PROCESSING_PRESET = PROCESSING_PRESET.BALANCED
+
+# frames waiting for a writer, and how many writers encode in parallel
+# (cv2 and PIL release the GIL while encoding)
+FRAME_QUEUE_SIZE: int = 64
+FRAME_WRITERS: int = 4
+
+# keyframe selection, scored on a small grayscale copy of each frame
+KEYFRAME_SCORE_WIDTH: int = 160
+MIN_SHARPNESS: float = 20.0          # laplacian variance, below this a frame is just blur
+MIN_VIEW_CHANGE: float = 6.0         # mean abs pixel difference to the last keyframe
+KEYFRAME_WINDOW: int = 5             # once the view has changed, keep the sharpest of this many frames
+
 """ 
 TODO 
 use an xbox 360 kinect as camera/lidar?
@@ -40,7 +58,7 @@ after converting to mesh, replace images with lower quality to save space?
 
 class ImgCollection:
     ID_FMT: str = "%Y_%m_%d_%H_%M_%S"
-    IMG_DIR_NAME: str = "images"
+    IMG_DIR_NAME: str = IMG_DIR_NAME
 
     def __init__(self, workspace: Path):
         os.makedirs(workspace, exist_ok=True)
@@ -49,40 +67,57 @@ class ImgCollection:
         self._collection_path: Path = self._workspace / self._id / ImgCollection.IMG_DIR_NAME
         self._idx_img: count = count(0)
 
+        self._path_ready: bool = False
+
+    def get_id(self) -> str:
+        return self._id
+
     def get_collection_path(self) -> Path:
         # creates a file structure for img collecting
         # workspace
         # | id
         # | | imgs <- collection path 
 
-        if not os.path.exists(self._collection_path):
+        if not self._path_ready:
             # TODO collision errors?
             os.makedirs(self._collection_path, exist_ok=True)
+            self._path_ready = True
         
         return self._collection_path
 
-    def collect_frame(self, frame: cv2.typing.MatLike) -> None:
+    def next_index(self) -> int:
+        return next(self._idx_img)
+
+    def write_frame(self, idx: int, frame: cv2.typing.MatLike) -> None:
         frame_rgb: cv2.typing.MatLike = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
         img: Image = Image.fromarray(frame_rgb)
-        # instead of using an idx i just hash the datetime
-        img_path = self.get_collection_path() / f"{next(self._idx_img)}.jpg"
-        ImagePreprocessor.save_to(img, img_path)
+        img_path = self.get_collection_path() / f"{idx}.jpg"
+        ImagePreprocessor.save_to(img, img_path, CAPTURE_PRESET)
+
+    def collect_frame(self, frame: cv2.typing.MatLike) -> None:
+        self.write_frame(self.next_index(), frame)
 
 class CaptureMethod(Enum):
     CAMERA: int = 0
+    FILE: int = 1  # a local video standing in for the camera
     
 class VideoCaptureDevice:
     FPS: int = 25
 
-    def __init__(self, method: CaptureMethod):
+    def __init__(self, method: CaptureMethod, source: Optional[str] = None):
         
         filename: str
         match method:
             case CaptureMethod.CAMERA:
                 ip = os.environ.get("CIP") or self._ask_for_ip()
                 filename = f"http://{ip}:4747/videofeed"
+            case CaptureMethod.FILE:
+                if source is None:
+                    raise ValueError("A video file is needed for CaptureMethod.FILE")
+                filename = source
             case _:
                 raise NotImplementedError()
+        self.method: CaptureMethod = method
         
         self._cap: cv2.VideoCapture = cv2.VideoCapture(filename)
         self._cap.set(cv2.CAP_PROP_FPS, VideoCaptureDevice.FPS) 
@@ -91,6 +126,9 @@ class VideoCaptureDevice:
     
     def read(self) -> tuple[bool, cv2.typing.MatLike]:
         return self._cap.read()
+
+    def release(self) -> None:
+        self._cap.release()
     
         
     def _ask_for_ip(self) -> str:
@@ -101,29 +139,234 @@ class VideoCaptureDevice:
             else:
                 print("Invalid IP. Please try again.")   
 
+class KeyframeSelector:
+    """
+    Streaming keyframe picker: waits until the view has moved far enough from
+    the last keyframe, then keeps the sharpest frame of the next few.
+    """
+
+    def __init__(
+        self,
+        min_sharpness: float = MIN_SHARPNESS,
+        min_view_change: float = MIN_VIEW_CHANGE,
+        window: int = KEYFRAME_WINDOW
+    ):
+        self.min_sharpness = min_sharpness
+        self.min_view_change = min_view_change
+        self.window = window
+
+        self._last_key: Optional[cv2.typing.MatLike] = None
+        self._best: Optional[tuple[float, cv2.typing.MatLike, cv2.typing.MatLike]] = None
+        self._seen_in_window: int = 0
+        self.offered: int = 0
+        self.rejected_blur: int = 0
+
+    @staticmethod
+    def _small_gray(frame: cv2.typing.MatLike) -> cv2.typing.MatLike:
+        h, w = frame.shape[:2]
+        scale = KEYFRAME_SCORE_WIDTH / w
+        small = cv2.resize(frame, (KEYFRAME_SCORE_WIDTH, max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    @staticmethod
+    def sharpness(gray: cv2.typing.MatLike) -> float:
+        return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+    def view_change(self, gray: cv2.typing.MatLike) -> float:
+        if self._last_key is None:
+            return float('inf')
+        return float(cv2.absdiff(gray, self._last_key).mean())
+
+    def offer(self, frame: cv2.typing.MatLike) -> Optional[cv2.typing.MatLike]:
+        """Feed every captured frame, returns a frame when a keyframe is decided"""
+        self.offered += 1
+        gray = self._small_gray(frame)
+        sharpness = self.sharpness(gray)
+
+        if sharpness < self.min_sharpness:
+            self.rejected_blur += 1
+        elif self._best is not None or self.view_change(gray) >= self.min_view_change:
+            # the view has moved, this frame competes in the open window
+            if self._best is None or sharpness > self._best[0]:
+                self._best = (sharpness, frame, gray)
+
+        if self._best is None:
+            return None
+
+        self._seen_in_window += 1
+        return self.flush() if self._seen_in_window >= self.window else None
+
+    def flush(self) -> Optional[cv2.typing.MatLike]:
+        """Hand over the pending best frame, e.g. when capture ends"""
+        if self._best is None:
+            return None
+        _, frame, gray = self._best
+        self._last_key = gray
+        self._best = None
+        self._seen_in_window = 0
+        return frame
+
+class DropPolicy(Enum):
+    OLDEST = 'oldest'  # make room by discarding the longest waiting frame
+    NEWEST = 'newest'  # discard the frame that just arrived
+
+@dataclass
+class CaptureStats:
+    captured: int = 0
+    skipped: int = 0  # not picked as keyframes
+    dropped: int = 0
+    written: int = 0
+    failed: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, **counts: int) -> None:
+        with self._lock:
+            for name, n in counts.items():
+                setattr(self, name, getattr(self, name) + n)
+
+class CaptureEngine:
+    """
+    Reader thread -> (keyframe selector) -> bounded frame queue -> writer pool.
+    The reader never waits on disk: when writers fall behind, frames are dropped
+    according to the drop policy instead of stalling the camera feed.
+    """
+
+    def __init__(
+        self,
+        cap: VideoCaptureDevice,
+        collector: ImgCollection,
+        fps: int = VideoCaptureDevice.FPS,
+        queue_size: int = FRAME_QUEUE_SIZE,
+        writers: int = FRAME_WRITERS,
+        drop_policy: DropPolicy = DropPolicy.OLDEST,
+        selector: Optional[KeyframeSelector] = None
+    ):
+        self.cap = cap
+        self.collector = collector
+        self.fps = fps
+        self.drop_policy = drop_policy
+        self.selector = selector
+        self.stats = CaptureStats()
+        self.latest_frame: Optional[cv2.typing.MatLike] = None
+
+        self._frames: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._writers = ThreadPoolExecutor(max_workers=writers)
+        self._n_writers = writers
+        self._stop = threading.Event()
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+
+    def start(self) -> None:
+        for _ in range(self._n_writers):
+            self._writers.submit(self._write_loop)
+        self._reader.start()
+
+    def stop(self) -> None:
+        """Stop capturing and wait for every queued frame to be written"""
+        self._stop.set()
+        self._reader.join()
+        for _ in range(self._n_writers):
+            self._frames.put(None)
+        self._writers.shutdown(wait=True)
+
+    def is_running(self) -> bool:
+        return self._reader.is_alive()
+
+    def _enqueue(self, item: tuple[int, cv2.typing.MatLike]) -> None:
+        try:
+            self._frames.put_nowait(item)
+            return
+        except queue.Full:
+            pass
+
+        if self.drop_policy == DropPolicy.NEWEST:
+            self.stats.add(dropped=1)
+            return
+
+        try:
+            self._frames.get_nowait()
+            self.stats.add(dropped=1)
+        except queue.Empty:
+            pass
+        try:
+            self._frames.put_nowait(item)
+        except queue.Full:
+            self.stats.add(dropped=1)
+
+    def _read_loop(self) -> None:
+        # pace to the target fps, files would otherwise be read as fast as possible
+        interval = 1 / self.fps
+        next_tick = time.perf_counter()
+        while not self._stop.is_set():
+            ret, frame = self.cap.read()
+            if not ret:
+                break
+
+            self.stats.add(captured=1)
+            self.latest_frame = frame
+            self._keep(frame)
+
+            next_tick += interval
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.perf_counter()  # fell behind, don't try to catch up in a burst
+
+        # the last window may still hold a keyframe
+        if self.selector:
+            last = self.selector.flush()
+            if last is not None:
+                self._enqueue((self.collector.next_index(), last))
+
+    def _keep(self, frame: cv2.typing.MatLike) -> None:
+        # indices are only handed to kept frames, so files stay numbered in capture order
+        if self.selector:
+            keyframe = self.selector.offer(frame)
+            if keyframe is None:
+                self.stats.add(skipped=1)
+                return
+            frame = keyframe
+        self._enqueue((self.collector.next_index(), frame))
+
+    def _write_loop(self) -> None:
+        while True:
+            item = self._frames.get()
+            if item is None:
+                return
+
+            idx, frame = item
+            try:
+                self.collector.write_frame(idx, frame)
+                self.stats.add(written=1)
+            except Exception as e:
+                self.stats.add(failed=1)
+                print(f"Could not write frame {idx}: {e}")
+
 def main():
     print("Please have DroidCam installed and steup on phone if u plan on using it!")
     cap = VideoCaptureDevice(CaptureMethod.CAMERA)
 
-    print("Hit enter to start collecting images and press `CTRL+C` to end collection...")
+    print("Hit enter to start collecting images and press `q` (or `CTRL+C`) to end collection...")
     input()
 
     collector: ImgCollection = ImgCollection(WORKSPACE)
+    engine: CaptureEngine = CaptureEngine(cap, collector, selector=KeyframeSelector())
     print("COLLECTING...")
+    engine.start()
     try:
-        while True:
-            ret, frame = cap.read()
-            if not ret:
+        # the window only previews, capture and writing happen on other threads
+        while engine.is_running():
+            if engine.latest_frame is not None:
+                cv2.imshow('Cam', engine.latest_frame)
+            if cv2.waitKey(1000 // VideoCaptureDevice.FPS) & 0xFF == ord('q'):
                 break
-
-            cv2.imshow('Cam', frame)
-            collector.collect_frame(frame)
     except KeyboardInterrupt:
-        pass # TODO figure out how to quit properly 
+        pass
     finally:
-        cap._cap.release()
+        engine.stop()
+        cap.release()
         cv2.destroyAllWindows()
-        print("DONE!")
+        print(f"DONE! {engine.stats}")
 
     remove_excess_captures(
         collection_path=collector.get_collection_path(),
@@ -132,17 +375,20 @@ def main():
 
     print(f"Ended with {len(os.listdir(collector.get_collection_path()))} photos")
 
-    print("Getting mesh...")
-    visualize(
-        fused_path=colmapper(collector.get_collection_path())
-    )
+    # reconstruction runs in `process_scans.py`, capture never waits on it
+    ScanQueue(WORKSPACE).enqueue(collector.get_id())
+    print(f"Queued scan {collector.get_id()}, run `python process_scans.py` to reconstruct it")
 
 
 def remove_excess_captures(collection_path: Path, max_collection: int) -> None:
     if not os.path.exists(collection_path):
         raise ValueError(f"{collection_path} does not exist")
 
-    collection: list[str] = os.listdir(collection_path)
+    # frames are numbered in capture order, listdir is not
+    collection: list[str] = sorted(
+        os.listdir(collection_path),
+        key=lambda name: int(Path(name).stem) if Path(name).stem.isdigit() else -1
+    )
     if len(collection) <= max_collection:
         return
     
@@ -158,68 +404,8 @@ def remove_excess_captures(collection_path: Path, max_collection: int) -> None:
             os.remove(collection_path / c)
 
 def colmapper(colection_path: Path) -> Path:
-    root: Path = colection_path.parent
-    db_path: Path = root / "datbase.db"
-    sparse_path: Path = root / "sparse"
-    os.makedirs(sparse_path, exist_ok=True)
-    dense_path: Path = root / "dense"
-    os.makedirs(dense_path, exist_ok=True)
-    
-    subprocess.run([
-        "colmap", "feature_extractor",
-        "--database_path", db_path,
-        "--image_path", colection_path,
-        "--ImageReader.single_camera", "1",
-        "--SiftExtraction.max_num_features", "8192"
-    ])
-
-    subprocess.run([
-        "colmap", "sequential_matcher",
-        "--database_path", db_path,
-        "--SequentialMatching.overlap", "10",
-    ])
-    
-    subprocess.run([
-        "colmap", "mapper",
-        "--database_path", db_path,
-        "--image_path", colection_path,
-        "--output_path", sparse_path,
-        "--Mapper.min_num_matches", "20"
-    ])
-
-    if not os.listdir(sparse_path):
-        raise IOError("Error with colmap mapper")
-
-    subprocess.run([
-        "colmap", "image_undistorter",
-        "--image_path", colection_path,
-        "--input_path", sparse_path/"0",
-        "--output_path", dense_path,
-        "--output_type", "COLMAP"
-    ])
-
-    if not os.listdir(dense_path):
-        raise IOError("Error with colmap image undistorter")
-
-    subprocess.run([
-        "colmap", "patch_match_stereo",
-        "--workspace_path", dense_path,
-        "--workspace_format", "COLMAP",
-        "--PatchMatchStereo.geom_consistency", "true",
-    ])
-
-    subprocess.run([
-        "colmap", "stereo_fusion",
-        "--workspace_path", dense_path,
-        "--workspace_format", "COLMAP",
-        "--input_type", "geometric",
-        "--output_path", dense_path/"fused.ply"
-    ])
-
-    if os.path.exists(dense_path/"fused.ply"):
-        return  dense_path/"fused.ply"
-    else:
-        raise IOError("Could not make mesh with colmap pipeline")
+    # stages that already finished for this scan are skipped, see ColmapPipeline
+    return ColmapPipeline(colection_path).run()
     
 def visualize(fused_path: Path) -> None:
     subprocess.run([
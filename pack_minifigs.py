@@ -0,0 +1,20 @@
+import logging
+from logging import info as print
+import time
+
+from MinifigDataset import MinifigDataset, DATASET_PATH
+
+PREFIX: str = ">>"
+logging.basicConfig(format=f'{PREFIX} %(message)s', level=logging.INFO)
+
+MINIFIG_DATA_PATH: str = "../minifigs"
+
+def main() -> None:
+    # pack the jpeg directory `download_minifig_imgs` fills into one memory-mapped array
+    print(f"Packing `{MINIFIG_DATA_PATH}` into `{DATASET_PATH}`...")
+    start = time.perf_counter()
+    dataset = MinifigDataset.from_directory(MINIFIG_DATA_PATH, DATASET_PATH)
+    print(f"Finished! {len(dataset)} figures packed in {time.perf_counter() - start:.1f}s")
+
+if __name__ == '__main__':
+    main()
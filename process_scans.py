@@ -0,0 +1,52 @@
+import argparse
+import os
+
+from ColmapPipeline import StageLimits
+from PointCloudMesher import FACE_BUDGET, Reconstruction
+from ScanQueue import ScanQueue, WORKSPACE
+
+# the heavy dense stages get the memory cap, the rest just share the cores
+DENSE_STAGES: tuple[str, ...] = ("patch_match_stereo", "stereo_fusion")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Reconstruct queued scans in the background')
+    parser.add_argument('--workspace', default=str(WORKSPACE))
+    parser.add_argument('--jobs', type=int, default=max(1, (os.cpu_count() or 1) // 4), help='scans processed at once')
+    parser.add_argument('--cpus', type=int, default=None, help='threads per stage')
+    parser.add_argument('--memory-mb', type=int, default=None, help='memory cap for the dense stages')
+    parser.add_argument('--method', default=Reconstruction.POISSON.value, choices=[m.value for m in Reconstruction])
+    parser.add_argument('--face-budget', type=int, default=FACE_BUDGET)
+    parser.add_argument('--watch', action='store_true', help='keep waiting for new scans')
+    parser.add_argument('--retry-failed', action='store_true')
+    parser.add_argument('--status', action='store_true', help='print the queue and exit')
+    args = parser.parse_args()
+
+    queue = ScanQueue(args.workspace, Reconstruction(args.method), args.face_budget)
+    queue.discover()
+
+    if args.status:
+        for job in queue.jobs():
+            print(f"{job.scan_id}  {job.state:<8} attempts={job.attempts}  {job.error or ''}")
+        return
+
+    if args.retry_failed:
+        for job in queue.jobs('failed'):
+            queue.enqueue(job.scan_id, force=True)
+
+    cpus = args.cpus or max(1, (os.cpu_count() or 1) // args.jobs)
+    limits = {
+        stage: StageLimits(cpus=cpus, memory_mb=args.memory_mb if stage in DENSE_STAGES else None)
+        for stage in ("feature_extractor", "sequential_matcher", "mapper", "image_undistorter", *DENSE_STAGES)
+    }
+
+    print(f"Processing scans in `{args.workspace}` with {args.jobs} job(s), {cpus} thread(s) each...")
+    try:
+        queue.run(concurrency=args.jobs, limits=limits, watch=args.watch)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        queue.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import threading
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from img_scan_to_mesh import (
+    CaptureEngine, CaptureMethod, DropPolicy, ImgCollection, KeyframeSelector, VideoCaptureDevice
+)
+
+SIZE = (320, 240)
+
+
+def scene(seed: int) -> np.ndarray:
+    # noise is as sharp as it gets, and two seeds are nothing alike
+    return np.random.default_rng(seed).integers(0, 256, (SIZE[1], SIZE[0], 3), dtype=np.uint8)
+
+
+def write_video(path: Path, frames: list[np.ndarray]) -> str:
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), 25, SIZE)
+    assert writer.isOpened()
+    for frame in frames:
+        writer.write(frame)
+    writer.release()
+    return str(path)
+
+
+def written(collector: ImgCollection) -> list[Path]:
+    return sorted(collector.get_collection_path().iterdir(), key=lambda p: int(p.stem))
+
+
+def closest_scene(path: Path, scenes: list[np.ndarray]) -> int:
+    image = cv2.imread(str(path))
+    return int(np.argmin([cv2.absdiff(image, s).mean() for s in scenes]))
+
+
+def run_engine(video: str, collector: ImgCollection, **kwargs) -> CaptureEngine:
+    cap = VideoCaptureDevice(CaptureMethod.FILE, video)
+    engine = CaptureEngine(cap, collector, fps=1000, **kwargs)
+    engine.start()
+    # a file ends on its own, wait for the reader to reach the end
+    while engine.is_running():
+        time.sleep(0.01)
+    return engine
+
+
+def test_file_capture_keeps_one_keyframe_per_view(tmp_path):
+    scenes = [scene(seed) for seed in range(3)]
+    flat = np.full((SIZE[1], SIZE[0], 3), 128, dtype=np.uint8)
+    video = write_video(tmp_path / 'scan.avi', [s for s in scenes for _ in range(5)] + [flat])
+
+    collector = ImgCollection(tmp_path / 'workspace')
+    selector = KeyframeSelector()
+    engine = run_engine(video, collector, selector=selector)
+    engine.stop()
+
+    assert engine.stats.captured == 16
+    assert engine.stats.skipped == 13
+    assert engine.stats.dropped == 0
+    assert engine.stats.written == 3
+    assert engine.stats.failed == 0
+    assert selector.rejected_blur == 1
+
+    files = written(collector)
+    assert [p.name for p in files] == ['0.jpg', '1.jpg', '2.jpg']
+    assert [closest_scene(p, scenes) for p in files] == [0, 1, 2]
+
+
+def test_slow_writers_drop_the_oldest_frames(tmp_path):
+    scenes = [scene(seed) for seed in range(10)]
+    video = write_video(tmp_path / 'scan.avi', scenes)
+    release = threading.Event()
+
+    class StalledCollection(ImgCollection):
+        def write_frame(self, idx, frame):
+            release.wait(10)
+            super().write_frame(idx, frame)
+
+    collector = StalledCollection(tmp_path / 'workspace')
+    engine = run_engine(video, collector, queue_size=2, writers=1, drop_policy=DropPolicy.OLDEST)
+    # the writer holds one frame, the queue the two newest
+    release.set()
+    engine.stop()
+
+    assert engine.stats.captured == 10
+    assert engine.stats.written == 3
+    assert engine.stats.dropped == 7
+
+    files = written(collector)
+    assert [p.name for p in files[1:]] == ['8.jpg', '9.jpg']
+    assert [closest_scene(p, scenes) for p in files] == [int(p.stem) for p in files]
+
+
+def test_file_capture_needs_a_source():
+    with pytest.raises(ValueError):
+        VideoCaptureDevice(CaptureMethod.FILE)
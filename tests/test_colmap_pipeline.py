@@ -0,0 +1,216 @@
+import json
+import os
+import resource
+import signal
+import stat
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+from ColmapPipeline import (
+    ColmapError, ColmapInterrupted, ColmapPipeline, REPORT_FILE, STATE_FILE, StageLimits, run_measured
+)
+
+STAGES = ["feature_extractor", "sequential_matcher", "mapper", "image_undistorter", "patch_match_stereo", "stereo_fusion"]
+
+# stands in for colmap: writes what each stage declares, logs its calls,
+# fails the stage named in FAKE_COLMAP_FAIL and Ctrl-Cs itself in FAKE_COLMAP_INTERRUPT
+FAKE_COLMAP = f"""#!{sys.executable}
+import os, resource, signal, sys
+from pathlib import Path
+
+stage, args = sys.argv[1], sys.argv[2:]
+opts = dict(zip(args[::2], args[1::2]))
+with open(os.environ["FAKE_COLMAP_LOG"], "a") as log:
+    log.write(stage + "\\n")
+if "FAKE_COLMAP_LIMITS" in os.environ:
+    with open(os.environ["FAKE_COLMAP_LIMITS"], "a") as log:
+        log.write(f"{{stage}} {{resource.getrlimit(resource.RLIMIT_AS)[0]}}\\n")
+if os.environ.get("FAKE_COLMAP_FAIL") == stage:
+    sys.exit(3)
+if os.environ.get("FAKE_COLMAP_INTERRUPT") == stage:
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    os.kill(os.getpid(), signal.SIGINT)
+
+def touch(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(stage)
+
+if stage == "feature_extractor":
+    db = Path(opts["--database_path"])
+    if db.exists():
+        sys.exit(4)  # colmap would quietly reuse the old features
+    touch(db)
+elif stage == "sequential_matcher":
+    with open(opts["--database_path"], "a") as db:
+        db.write("matches")
+elif stage == "mapper":
+    touch(Path(opts["--output_path"]) / "0" / "points3D.bin")
+elif stage == "image_undistorter":
+    touch(Path(opts["--output_path"]) / "images" / "0.jpg")
+    touch(Path(opts["--output_path"]) / "sparse" / "points3D.bin")
+elif stage == "patch_match_stereo":
+    touch(Path(opts["--workspace_path"]) / "stereo" / "depth_maps" / "0.jpg.geometric.bin")
+elif stage == "stereo_fusion":
+    touch(Path(opts["--output_path"]))
+"""
+
+
+@pytest.fixture
+def scan(tmp_path, monkeypatch):
+    fake = tmp_path / "colmap"
+    fake.write_text(FAKE_COLMAP)
+    fake.chmod(fake.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("COLMAP_BIN", str(fake))
+    monkeypatch.setenv("FAKE_COLMAP_LOG", str(tmp_path / "calls.log"))
+
+    images = tmp_path / "scan" / "images"
+    images.mkdir(parents=True)
+    (images / "0.jpg").write_bytes(b"frame")
+    return images
+
+
+def make_pipeline(images: Path) -> ColmapPipeline:
+    return ColmapPipeline(images, colmap_bin=os.environ["COLMAP_BIN"])
+
+
+def calls(images: Path) -> list[str]:
+    log = images.parent.parent / "calls.log"
+    stages = log.read_text().split() if log.exists() else []
+    log.unlink(missing_ok=True)
+    return stages
+
+
+def report(images: Path) -> dict:
+    return json.loads((images.parent / REPORT_FILE).read_text())
+
+
+def test_full_run_then_everything_skipped(scan):
+    fused = make_pipeline(scan).run()
+    assert fused.exists()
+    assert calls(scan) == STAGES
+
+    first = report(scan)
+    assert "failed_stage" not in first
+    assert [s["name"] for s in first["stages"]] == STAGES
+    for s in first["stages"]:
+        assert s["skipped"] is False
+        assert s["exit_code"] == 0
+        assert s["wall_time_s"] >= 0
+        assert s["peak_rss_mib"] > 0
+    assert set(json.loads((scan.parent / STATE_FILE).read_text())) == set(STAGES)
+
+    make_pipeline(scan).run()
+    assert calls(scan) == []
+    assert all(s["skipped"] for s in report(scan)["stages"])
+
+
+def test_failed_run_resumes_from_failing_stage(scan, monkeypatch):
+    monkeypatch.setenv("FAKE_COLMAP_FAIL", "mapper")
+    with pytest.raises(ColmapError) as e:
+        make_pipeline(scan).run()
+    assert e.value.stage == "mapper"
+    assert calls(scan) == STAGES[:3]
+
+    failed = report(scan)
+    assert failed["failed_stage"] == "mapper"
+    assert [s["name"] for s in failed["stages"]] == STAGES[:3]
+    assert failed["stages"][-1]["exit_code"] == 3
+
+    monkeypatch.delenv("FAKE_COLMAP_FAIL")
+    make_pipeline(scan).run()
+    assert calls(scan) == STAGES[2:]
+    assert [s["skipped"] for s in report(scan)["stages"]] == [True, True, False, False, False, False]
+
+
+def test_changed_input_reruns_on_cleared_outputs(scan):
+    make_pipeline(scan).run()
+    calls(scan)
+    (scan.parent / "sparse" / "1").mkdir()  # a second model from the old run
+
+    (scan / "1.jpg").write_bytes(b"another frame")
+    make_pipeline(scan).run()
+    # the fake extractor fails on an existing database
+    assert calls(scan) == STAGES
+    assert not (scan.parent / "sparse" / "1").exists()
+
+
+def test_missing_outputs_rerun_the_stage(scan):
+    pipeline = make_pipeline(scan)
+    pipeline.run()
+    calls(scan)
+
+    os.remove(pipeline.fused_path)
+    pipeline.run()
+    assert calls(scan) == ["stereo_fusion"]
+
+
+def test_missing_binary_is_a_colmap_error(scan, tmp_path):
+    pipeline = ColmapPipeline(scan, colmap_bin=str(tmp_path / "no-colmap"))
+    with pytest.raises(ColmapError) as e:
+        pipeline.run()
+    assert e.value.stage == "feature_extractor"
+    assert report(scan)["failed_stage"] == "feature_extractor"
+
+
+def test_interrupted_stage_is_not_a_failure(scan, monkeypatch):
+    monkeypatch.setenv("FAKE_COLMAP_INTERRUPT", "patch_match_stereo")
+    with pytest.raises(ColmapInterrupted) as e:
+        make_pipeline(scan).run()
+    assert e.value.stage == "patch_match_stereo"
+    interrupted = report(scan)
+    assert interrupted["interrupted"] is True
+    assert interrupted["failed_stage"] == "patch_match_stereo"
+    calls(scan)
+
+    monkeypatch.delenv("FAKE_COLMAP_INTERRUPT")
+    make_pipeline(scan).run()
+    assert calls(scan) == STAGES[4:]
+
+
+def test_cancel_stops_before_the_next_stage(scan):
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(ColmapInterrupted) as e:
+        ColmapPipeline(scan, colmap_bin=os.environ["COLMAP_BIN"], cancel=cancel).run()
+    assert e.value.stage == "feature_extractor"
+    assert calls(scan) == []
+
+
+def test_memory_cap_skips_cuda_stages(scan, tmp_path, monkeypatch):
+    monkeypatch.setenv("FAKE_COLMAP_LIMITS", str(tmp_path / "limits.log"))
+    limits = {stage: StageLimits(cpus=2, memory_mb=4096) for stage in STAGES}
+    ColmapPipeline(scan, colmap_bin=os.environ["COLMAP_BIN"], limits=limits).run()
+
+    seen = dict(line.split() for line in (tmp_path / "limits.log").read_text().splitlines())
+    assert int(seen["stereo_fusion"]) == 4096 * 1024 * 1024
+    assert int(seen["patch_match_stereo"]) == resource.getrlimit(resource.RLIMIT_AS)[0]
+
+
+def test_missing_binary_under_a_memory_cap(scan, tmp_path):
+    limits = {"feature_extractor": StageLimits(memory_mb=4096)}
+    pipeline = ColmapPipeline(scan, colmap_bin=str(tmp_path / "no-colmap"), limits=limits)
+    with pytest.raises(ColmapError) as e:
+        pipeline.run()
+    assert e.value.stage == "feature_extractor"
+
+
+def test_interrupted_wait_kills_and_reaps_the_stage(tmp_path):
+    pid_file = tmp_path / "pid"
+
+    def interrupt(signum, frame):
+        raise RuntimeError("interrupted")
+
+    previous = signal.signal(signal.SIGALRM, interrupt)
+    signal.setitimer(signal.ITIMER_REAL, 0.5)
+    try:
+        with pytest.raises(RuntimeError):
+            run_measured(["sh", "-c", f"echo $$ > {pid_file}; exec sleep 30"])
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+    with pytest.raises(ProcessLookupError):
+        os.kill(int(pid_file.read_text()), 0)
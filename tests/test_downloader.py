@@ -0,0 +1,145 @@
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from Downloader import DownloadError, Downloader, SUBMIT_AHEAD
+
+# path -> list of (status, headers, delay) served in turn, the last one repeats
+ROUTES: dict[str, list[tuple[int, dict, float]]] = {
+    '/ok': [(200, {}, 0)],
+    '/missing': [(404, {}, 0)],
+    '/busy-then-ok': [(503, {'Retry-After': '1'}, 0), (200, {}, 0)],
+    '/always-busy': [(503, {}, 0)],
+    '/slow': [(200, {}, 2.0)],
+}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    hits: Counter = Counter()
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            attempt = self.hits[self.path]
+            self.hits[self.path] += 1
+        responses = ROUTES.get(self.path, [(404, {}, 0)])
+        status, headers, delay = responses[min(attempt, len(responses) - 1)]
+
+        time.sleep(delay)
+        body = self.path.encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    StandInHandler.hits = Counter()
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def downloader():
+    downloader = Downloader(concurrency=4, timeout=(1.0, 0.5), max_retries=2, backoff=0.01)
+    yield downloader
+    downloader.close()
+
+
+def test_fetch_ok(server, downloader):
+    response = downloader.fetch(f'{server}/ok')
+    assert response.status_code == 200
+    assert response.content == b'/ok'
+
+
+def test_retries_503_honouring_retry_after(server, downloader):
+    start = time.monotonic()
+    response = downloader.fetch(f'{server}/busy-then-ok')
+    assert response.status_code == 200
+    assert StandInHandler.hits['/busy-then-ok'] == 2
+    assert time.monotonic() - start >= 1.0
+
+
+def test_gives_up_after_max_retries(server, downloader):
+    with pytest.raises(DownloadError) as e:
+        downloader.fetch(f'{server}/always-busy')
+    assert e.value.reason == 'HTTP 503'
+    assert e.value.attempts == 3
+    assert StandInHandler.hits['/always-busy'] == 3
+
+
+def test_no_retry_on_404(server, downloader):
+    with pytest.raises(DownloadError) as e:
+        downloader.fetch(f'{server}/missing')
+    assert e.value.reason == 'HTTP 404'
+    assert e.value.attempts == 1
+    assert StandInHandler.hits['/missing'] == 1
+
+
+def test_read_timeout_is_retried(server, downloader):
+    with pytest.raises(DownloadError) as e:
+        downloader.fetch(f'{server}/slow')
+    assert e.value.reason == 'ReadTimeout'
+    assert e.value.attempts == 3
+
+
+def test_failure_report(server, downloader, tmp_path):
+    handled = []
+
+    def handle(key, url, response):
+        if key == 'broken':
+            raise ValueError('bad image')
+        handled.append(key)
+
+    failures = downloader.run([
+        ('a', f'{server}/ok'),
+        ('b', f'{server}/missing'),
+        ('c', f'{server}/always-busy'),
+        ('broken', f'{server}/ok', {'If-None-Match': '"x"'}),
+    ], handle)
+
+    assert handled == ['a']
+    assert failures == {
+        'b': {'url': f'{server}/missing', 'reason': 'HTTP 404', 'attempts': 1},
+        'c': {'url': f'{server}/always-busy', 'reason': 'HTTP 503', 'attempts': 3},
+        'broken': {'url': f'{server}/ok', 'reason': 'ValueError: bad image', 'attempts': 1},
+    }
+
+    report = tmp_path / 'failures.json'
+    downloader.write_report(str(report))
+    assert json.loads(report.read_text()) == failures
+
+
+def test_jobs_are_pulled_lazily(server, downloader):
+    pulled = 0
+    seen_at_first_handle = []
+
+    def jobs():
+        nonlocal pulled
+        for i in range(100):
+            pulled += 1
+            yield str(i), f'{server}/ok'
+
+    def handle(key, url, response):
+        if not seen_at_first_handle:
+            seen_at_first_handle.append(pulled)
+            time.sleep(0.2)  # an unbounded submit loop would drain the generator meanwhile
+
+    assert downloader.run(jobs(), handle) == {}
+    assert pulled == 100
+    assert seen_at_first_handle[0] <= SUBMIT_AHEAD * downloader.concurrency + 1
@@ -0,0 +1,94 @@
+import subprocess
+import threading
+from pathlib import Path
+
+import pytest
+
+from ColmapPipeline import ColmapError, ColmapInterrupted
+from ScanQueue import ScanQueue
+
+
+class StandInQueue(ScanQueue):
+    """Runs a scripted outcome per scan instead of colmap and meshing"""
+
+    def __init__(self, workspace: Path, outcomes: dict):
+        super().__init__(workspace)
+        self.outcomes = outcomes
+        self.processed: list[str] = []
+
+    def process(self, scan_id, limits=None, cancel=None) -> Path:
+        self.processed.append(scan_id)
+        outcome = self.outcomes.get(scan_id)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return self.workspace / scan_id / "mesh.ply"
+
+
+def make_scan(workspace: Path, scan_id: str) -> None:
+    (workspace / scan_id / "images").mkdir(parents=True)
+
+
+def states(queue: ScanQueue) -> dict[str, tuple[str, int]]:
+    return {job.scan_id: (job.state, job.attempts) for job in queue.jobs()}
+
+
+def test_discover_and_drain(tmp_path):
+    for scan_id in ("a", "b", "c"):
+        make_scan(tmp_path, scan_id)
+    queue = StandInQueue(tmp_path, {"b": ColmapError("mapper", "exit code 3")})
+    assert queue.discover() == ["a", "b", "c"]
+    assert queue.discover() == []
+
+    done = []
+    queue.run(concurrency=2, on_done=lambda scan_id, path, error: done.append((scan_id, error is None)))
+    assert sorted(done) == [("a", True), ("b", False), ("c", True)]
+    assert states(queue) == {"a": ("done", 1), "b": ("failed", 1), "c": ("done", 1)}
+    assert "mapper" in queue.jobs("failed")[0].error
+
+
+def test_force_requeues_finished_scans(tmp_path):
+    queue = StandInQueue(tmp_path, {})
+    queue.enqueue("a")
+    queue.run()
+    queue.enqueue("a")
+    assert states(queue) == {"a": ("done", 1)}
+    queue.enqueue("a", force=True)
+    queue.run()
+    assert states(queue) == {"a": ("done", 2)}
+
+
+def test_interrupted_scan_goes_back_to_the_queue(tmp_path):
+    queue = StandInQueue(tmp_path, {"a": ColmapInterrupted("patch_match_stereo", "interrupted")})
+    queue.enqueue("a")
+    queue.enqueue("b")
+    queue.run()
+    # the interruption stops the worker before it claims anything else
+    assert queue.processed == ["a"]
+    assert states(queue) == {"a": ("pending", 0), "b": ("pending", 0)}
+
+
+def test_orphaned_running_scan_is_recovered(tmp_path):
+    queue = StandInQueue(tmp_path, {})
+    queue.enqueue("a")
+    assert queue.claim() == "a"
+    # as if the worker that claimed it had died
+    dead = subprocess.Popen(["true"])
+    dead.wait()
+    queue._conn.execute("UPDATE jobs SET worker_pid = ?", (dead.pid,))
+    queue._conn.commit()
+
+    assert queue.recover() == ["a"]
+    queue.run()
+    assert states(queue) == {"a": ("done", 2)}
+
+
+def test_worker_crash_is_raised_and_stops_the_others(tmp_path):
+    class BrokenQueue(StandInQueue):
+        def claim(self):
+            raise RuntimeError("database is locked")
+
+    queue = BrokenQueue(tmp_path, {})
+    stop = threading.Event()
+    with pytest.raises(RuntimeError, match="database is locked"):
+        queue.run(concurrency=2, stop=stop)
+    assert stop.is_set()
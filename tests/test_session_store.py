@@ -0,0 +1,96 @@
+import pytest
+import trimesh
+
+from InteractiveModel import InteractiveModel
+from Model import Model
+from SessionStore import MemorySessionStore, SQLiteSessionStore, SessionManager
+
+
+@pytest.fixture(scope='module')
+def model(tmp_path_factory):
+    path = tmp_path_factory.mktemp('mesh') / 'sphere.ply'
+    trimesh.creation.icosphere(subdivisions=3).export(path)
+    return Model(str(path), use_cache=False)
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_store(request, tmp_path):
+    if request.param == 'memory':
+        store = MemorySessionStore()
+        return lambda: store
+    return lambda: SQLiteSessionStore(str(tmp_path / 'sessions.db'))
+
+
+def stored_points(store, session_id: str) -> list:
+    return store.load(session_id)['points']
+
+
+def test_only_changes_are_written_and_reload_matches(model, make_store):
+    store = make_store()
+    sessions = SessionManager(model, store)
+
+    sessions.update('s', lambda im: [im.add_point(float(i), 0.0, 0.0) for i in range(5)])
+    sessions.update('s', lambda im: im.interact_with_point(3.0, 0.0, 0.0))
+    sessions.update('s', lambda im: im.remove_point(1.0, 0.0, 0.0))
+    state = store.load('s')
+    assert state['version'] == 3
+    assert [p[0] for p in state['points']] == [0.0, 4.0, 2.0, 3.0]
+    assert state['highlighted'] == 3
+
+    # a second worker rebuilds the same session from the store
+    other = SessionManager(model, make_store())
+    assert other.update('s', lambda im: im.to_state()) == sessions.update('s', lambda im: im.to_state())
+
+    sessions.update('s', lambda im: im.clear_points())
+    assert stored_points(store, 's') == []
+
+
+def test_take_changes_is_incremental(model):
+    im = InteractiveModel(model)
+    for i in range(3):
+        im.add_point(float(i), 0.0, 0.0)
+    assert [p[0] for p in im.take_changes()['points']] == [0, 1, 2]
+
+    im.add_point(9.0, 0.0, 0.0)
+    im.interact_with_point(0.0, 0.0, 0.0)
+    changes = im.take_changes()
+    assert [p[0] for p in changes['points']] == [3]
+    assert changes['highlighted'] == 0
+
+    im.remove_point(0.0, 0.0, 0.0)
+    changes = im.take_changes()
+    assert [p[:2] for p in changes['points']] == [[0, 9.0]]
+    assert (changes['size'], changes['flushed_size']) == (3, 4)
+
+
+def test_conflicting_write_is_retried_on_fresh_state(model, make_store):
+    worker_a = SessionManager(model, make_store())
+    worker_b = SessionManager(model, make_store())
+    worker_a.update('s', lambda im: im.add_point(0.0, 0.0, 0.0))
+    attempts = []
+
+    def add_while_b_writes(im: InteractiveModel):
+        attempts.append(len(im.store))
+        if len(attempts) == 1:
+            # the store is not locked while a callback computes, b commits in between
+            worker_b.update('s', lambda other: other.add_point(1.0, 0.0, 0.0))
+        return im.add_point(2.0, 0.0, 0.0)
+
+    row = worker_a.update('s', add_while_b_writes, lambda im, row: (row, len(im.store)))
+    assert attempts == [1, 2]
+    assert row == (2, 3)
+    assert [p[0] for p in stored_points(worker_a.store, 's')] == [0.0, 1.0, 2.0]
+
+
+def test_failed_change_is_not_stored(model, make_store):
+    sessions = SessionManager(model, make_store())
+    sessions.update('s', lambda im: im.add_point(0.0, 0.0, 0.0))
+
+    def fail(im: InteractiveModel):
+        im.add_point(1.0, 0.0, 0.0)
+        raise ValueError('bad click')
+
+    with pytest.raises(ValueError):
+        sessions.update('s', fail)
+    assert sessions.update('s', lambda im: len(im.store)) == 1
+    assert len(stored_points(sessions.store, 's')) == 1